@@ -1,16 +1,200 @@
 """CS 88 presents Ants Vs. SomeBees."""
 
+import contextlib
 import random
+from bisect import bisect_left, insort
 from ucb import main, interact, trace
 from collections import OrderedDict
+from operator import attrgetter
+from state import State, MISSING
+
+##########
+# Events #
+##########
+
+EVENT_KINDS = ('damage', 'death', 'move', 'deploy', 'remove', 'throw', 'turn',
+               'end')
+
+class EventBus(object):
+    """Delivers game events to the sinks that subscribe to them.
+
+    A sink is called as sink(kind, *args) with the arguments of its event:
+    damage -- (insect, amount) after an insect's armor is reduced
+    death -- (insect, place) when an insect runs out of armor in place
+    move -- (bee, origin, destination) after a bee moves
+    deploy -- (ant, place) after the colony deploys an ant
+    remove -- (ant, place) after the colony removes an ant from place
+    throw -- (thrower, target) when a thrower throws at a bee
+    turn -- (colony,) after each complete turn
+    end -- (colony,) when the game is over
+
+    Events are only built while a sink is subscribed; every emitter checks
+    the active flag first, so the bus costs one attribute lookup otherwise.
+    The events of a colony can be dropped for a while with mute, as for the
+    rollouts of a search, while those of other games are still delivered.
+
+    >>> bus = EventBus()
+    >>> bus.subscribe(print, ['move'])
+    >>> bus.active
+    True
+    >>> bus.emit('move', 'bee', 'here', 'there')
+    move bee here there
+    >>> bus.emit('damage', 'bee', 1)
+    >>> bus.unsubscribe(print)
+    >>> bus.active
+    False
+    """
+
+    def __init__(self):
+        self.sinks = {kind: [] for kind in EVENT_KINDS}
+        self.active = False
+        self.muted = set()  # Colonies whose events are dropped
+
+    def subscribe(self, sink, kinds=EVENT_KINDS):
+        """Call SINK for every event of the given KINDS."""
+        for kind in kinds:
+            self.sinks[kind] = self.sinks[kind] + [sink]
+        self.active = True
+
+    def unsubscribe(self, sink):
+        """Stop calling SINK for any event. Sinks may unsubscribe themselves
+        while an event is delivered."""
+        for kind, sinks in self.sinks.items():
+            self.sinks[kind] = [s for s in sinks if s is not sink]
+        self.active = any(self.sinks.values())
+
+    def emit(self, kind, *args):
+        if self.muted and event_colony(kind, args) in self.muted:
+            return
+        for sink in self.sinks[kind]:
+            sink(kind, *args)
+
+    @contextlib.contextmanager
+    def mute(self, colony):
+        """Drop the events of COLONY within this context. Sinks may still
+        subscribe and unsubscribe, and other colonies' events are delivered.
+
+        >>> bus = EventBus()
+        >>> bus.subscribe(print, ['end'])
+        >>> with bus.mute('colony'):
+        ...     bus.emit('end', 'colony')
+        ...     bus.emit('end', 'other colony')
+        end other colony
+        >>> bus.emit('end', 'colony')
+        end colony
+        """
+        self.muted.add(colony)
+        try:
+            yield colony
+        finally:
+            self.muted.discard(colony)
+
+class BatchedSink(object):
+    """A sink that buffers events and passes them to FLUSH as one list of
+    (kind, args) pairs at the end of each turn and of the game.
+
+    >>> bus = EventBus()
+    >>> bus.subscribe(BatchedSink(print))
+    >>> bus.emit('damage', 'bee', 1)
+    >>> bus.emit('turn', 'colony')
+    [('damage', ('bee', 1)), ('turn', ('colony',))]
+    """
+
+    def __init__(self, flush):
+        self.flush = flush
+        self.buffer = []
+
+    def __call__(self, kind, *args):
+        self.buffer.append((kind, args))
+        if kind == 'turn' or kind == 'end':
+            buffer, self.buffer = self.buffer, []
+            self.flush(buffer)
+
+event_bus = EventBus()  # The events of every game in this process
+
+def event_colony(kind, args):
+    """Return the colony in which the event of KIND with ARGS happened, or
+    None if it happened outside of any colony. Sinks of one game use it to
+    ignore the events of other games in the same process.
+
+    >>> place = Place('here')
+    >>> event_colony('death', (Bee(0), place)) is None
+    True
+    >>> event_colony('end', ('colony',))
+    'colony'
+    """
+    if kind == 'turn' or kind == 'end':
+        return args[0]
+    if kind == 'damage' or kind == 'throw':
+        place = args[0].place
+    else:  # death, deploy, remove and move, whose second argument is a place
+        place = args[1]
+    return None if place is None else place.colony
 
 ################
 # Core Classes #
 ################
 
+class InsectList(dict):
+    """An insertion-ordered collection of insects, used for the bees of a
+    Place and the active bees of a colony.
+
+    Insects are appended and removed in constant time, and iterate in the
+    order they were appended. Indexing, as by random.choice, reads a list of
+    the insects that is only rebuilt after the collection changes, so random
+    choices are the same as from a list of the insects.
+
+    >>> bees = InsectList([Bee(1), Bee(2)])
+    >>> third = Bee(3)
+    >>> bees.append(third)
+    >>> bees.remove(bees[0])
+    >>> bees
+    [Bee(2, None), Bee(3, None)]
+    >>> third in bees, len(bees), bees[-1] is third
+    (True, 2, True)
+    """
+
+    __slots__ = ('_list',)
+
+    def __init__(self, insects=()):
+        for insect in insects:
+            self[insect] = None
+        self._list = None
+
+    def append(self, insect):
+        self[insect] = None
+        self._list = None
+
+    def remove(self, insect):
+        try:
+            del self[insect]
+        except KeyError:
+            raise ValueError('{0} is not in the list'.format(insect))
+        self._list = None
+
+    def __getitem__(self, index):
+        if self._list is None:
+            self._list = list(self)
+        return self._list[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, InsectList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return repr(list(self))
+
 class Place(object):
     """A Place holds insects and has an exit to another Place."""
 
+    __slots__ = ('name', 'exit', 'bees', 'ant', 'entrance', 'colony', 'id',
+                 'tunnel', 'depth')
+
     def __init__(self, name, exit=None):
         """Create a Place with the given NAME and EXIT.
 
@@ -19,9 +203,13 @@ class Place(object):
         """
         self.name = name
         self.exit = exit
-        self.bees = []        # A list of Bees
+        self.bees = InsectList()  # The Bees, in the order they arrived
         self.ant = None       # An Ant
         self.entrance = None  # A Place
+        self.colony = None    # The AntColony that indexes this Place's insects
+        self.id = None        # The index of this Place in its colony's Topology
+        self.tunnel = None    # The Tunnel of this Place, set by AntColony
+        self.depth = None     # The number of entrances from the queen to here
         # Phase 1: Add an entrance to the exit
         # BEGIN Problem 2
         if self.exit:
@@ -55,6 +243,8 @@ class Place(object):
         else:
             self.bees.append(insect)
         insect.place = self
+        if self.colony is not None:
+            self.colony.update_index(self, insect)
 
     def remove_insect(self, insect):
         """Remove an INSECT from this Place.
@@ -93,16 +283,71 @@ class Place(object):
             self.bees.remove(insect)
 
         insect.place = None
+        if self.colony is not None:
+            self.colony.update_index(self, insect)
+
+    def damage_bees(self, amount):
+        """Reduce the armor of every Bee in this Place by AMOUNT, as changed
+        by the damage_modifier of each bee, and remove the expired bees.
+
+        This is equivalent to calling reduce_armor on each bee in turn, but
+        the colony index is only updated once all the bees are damaged.
+
+        >>> place = Place('swarm')
+        >>> for armor in (1, 2, 3):
+        ...     place.add_insect(Bee(armor))
+        >>> place.add_insect(Boss(20))
+        >>> place.damage_bees(2)
+        >>> place.bees
+        [Bee(1, swarm), Boss(18.4, swarm)]
+        """
+        bees = self.bees
+        for bee in bees:
+            if type(bee).reduce_armor not in _PLAIN_REDUCE_ARMOR:
+                for bee in bees[:]:  # A bee with its own reduce_armor
+                    bee.reduce_armor(amount)
+                return
+        expired = []
+        active = event_bus.active
+        for bee in bees:
+            damage = amount if bee.damage_modifier is None else bee.damage_modifier(amount)
+            bee.armor -= damage
+            if active:
+                event_bus.emit('damage', bee, damage)
+                if bee.armor <= 0:
+                    event_bus.emit('death', bee, self)
+            if bee.armor <= 0:
+                expired.append(bee)
+        if self.colony is not None:
+            self.colony.record_change(*bees)
+        if not expired:
+            return
+        for bee in expired:
+            bees.remove(bee)
+        for bee in expired:
+            bee.place = None
+            if self.colony is not None:
+                self.colony.update_index(self, bee)
+        for bee in expired:
+            bee.death_callback()
 
     def __str__(self):
         return self.name
 
 
 class Insect(object):
-    """An Insect, the base class of Ant and Bee, has armor and a Place."""
+    """An Insect, the base class of Ant and Bee, has armor and a Place.
+
+    Insects and Bees use __slots__, since assault plans may hold millions of
+    Bees. Ants keep a __dict__ for their instance attributes, such as the
+    damage doubled by a QueenAnt or the contained_ant of a container.
+    """
+
+    __slots__ = ('armor', 'place')
 
     is_ant = False
     damage = 0
+    damage_modifier = None  # A method that changes the damage dealt to it
     # ADD CLASS ATTRIBUTES HERE
     is_watersafe = False #insects are not watersafe by default, override later
     def __init__(self, armor, place=None):
@@ -120,6 +365,11 @@ class Insect(object):
         3
         """
         self.armor -= amount
+        self._record_change()
+        if event_bus.active:
+            event_bus.emit('damage', self, amount)
+            if self.armor <= 0:
+                event_bus.emit('death', self, self.place)
         if self.armor <= 0:
             self.place.remove_insect(self)
             self.death_callback()
@@ -130,6 +380,15 @@ class Insect(object):
         colony -- The AntColony, used to access game state information.
         """
 
+    def _record_change(self):
+        """Have the colony of this insect's place store it in its next
+        snapshot, after its armor or attributes changed."""
+        place = self.place
+        if place is not None and place.colony is not None:
+            changed = place.colony._changed
+            if changed is not None:
+                changed.add(self)
+
     def death_callback(self):
         # overriden by the gui
         pass
@@ -142,6 +401,8 @@ class Insect(object):
 class Bee(Insect):
     """A Bee moves from place to place, following exits and stinging ants."""
 
+    __slots__ = ()
+
     name = 'Bee'
     damage = 1
     # OVERRIDE CLASS ATTRIBUTES HERE
@@ -153,8 +414,11 @@ class Bee(Insect):
 
     def move_to(self, place):
         """Move from the Bee's current Place to a new PLACE."""
-        self.place.remove_insect(self)
+        origin = self.place
+        origin.remove_insect(self)
         place.add_insect(self)
+        if event_bus.active:
+            event_bus.emit('move', self, origin, place)
 
     def blocked(self):
         """Return True if this Bee cannot advance to the next Place."""
@@ -228,9 +492,32 @@ class ThrowerAnt(Ant):
         the ThrowerAnt's Place by following entrances.
 
         This method returns None if there is no such Bee (or none in range).
+        Every choice of a Bee is drawn from the random stream of the colony:
+
+        >>> from ants_plans import make_normal_assault_plan
+        >>> colony = AntColony(None, Hive(make_normal_assault_plan()), ant_types(),
+        ...                    dry_layout, (1, 9), food=3, seed=1)
+        >>> thrower = colony.deploy_ant('Hive', 'Thrower')
+        >>> targets = []
+        >>> for global_seed in range(3):
+        ...     random.seed(global_seed)
+        ...     colony.rng.seed(1)
+        ...     targets.append(thrower.nearest_bee(colony.beehive))
+        >>> targets[0] is targets[1] is targets[2]
+        True
         """
+        # Places in a colony's tunnel are found through its index of bees
+        tunnel = self.place.tunnel
+        if tunnel is not None:
+            place = tunnel.nearest_bee_place(self.place.depth, self.min_range,
+                                             self.max_range)
+            return random_or_none((place or self.place).bees,
+                                  self.place.colony.rng)
+
         # BEGIN Problem 3 and 4
         #as of 4:13 pm, 4/14/2021, this game runs properly up to problem 2, delete problem 3 if issues arise
+        # Places outside a colony draw from the global random module
+        rng = random if self.place.colony is None else self.place.colony.rng
         place = self.place
         dist = 0
         while place:
@@ -238,19 +525,21 @@ class ThrowerAnt(Ant):
                 break
             else:
                 if place.bees and (dist >= self.min_range and dist < self.max_range):
-                    return random_or_none(place.bees)
+                    return random_or_none(place.bees, rng)
                 else:
                     dist += 1
                     place = place.entrance
                     
         
-        return random_or_none(self.place.bees)
+        return random_or_none(self.place.bees, rng)
         # END Problem 3 and 4
 
     def throw_at(self, target):
         """Throw a leaf at the TARGET Bee, reducing its armor."""
 
         if target is not None:
+            if event_bus.active:
+                event_bus.emit('throw', self, target)
             target.reduce_armor(self.damage)
 
 
@@ -258,11 +547,12 @@ class ThrowerAnt(Ant):
         """Throw a leaf at the nearest Bee in range."""
         self.throw_at(self.nearest_bee(colony.beehive))
 
-def random_or_none(s):
-    """Return a random element of sequence S, or return None if S is empty."""
-    assert isinstance(s, list), "random_or_none's argument should be a list but was a %s" % type(s).__name__
+def random_or_none(s, rng=random):
+    """Return a random element of sequence S, or return None if S is empty.
+    Elements are chosen by RNG, which defaults to the global random module."""
+    assert isinstance(s, (list, InsectList)), "random_or_none's argument should be a list but was a %s" % type(s).__name__
     if s:
-        return random.choice(s)
+        return rng.choice(s)
 
 ##############
 # Extensions #
@@ -322,15 +612,18 @@ class FireAnt(Ant):
         """
         # BEGIN Problem 5
         self.armor -= amount
+        self._record_change()
+        if event_bus.active:
+            event_bus.emit('damage', self, amount)
+            if self.armor <= 0:
+                event_bus.emit('death', self, self.place)
         #reduce armor by amount + fire ant damage if fire ant dies
         if self.armor <= 0:    
-            for bee in self.place.bees[:]:
-                bee.reduce_armor(amount + self.damage)
+            self.place.damage_bees(amount + self.damage)
             self.place.remove_insect(self)
             self.death_callback()
         else:
-            for bee in self.place.bees[:]:
-                bee.reduce_armor(amount)
+            self.place.damage_bees(amount)
 
         
         # END Problem 5
@@ -365,10 +658,11 @@ class HungryAnt(Ant):
 #            print(bee.armor)  #delete later, for debugging
         #decrement turns spent digesting
         assert (self.digesting >= 0)
+        colony.record_change(self)
         if self.digesting > 0:
             self.digesting -= 1 #go down one digesting per turn elapsed
         else:
-            rand_bee = random_or_none(self.place.bees) #generate random bee to eat if not digesting
+            rand_bee = random_or_none(self.place.bees, colony.rng) #generate random bee to eat if not digesting
             if rand_bee:
                 self.eat_bee(rand_bee)
                 self.digesting = self.time_to_digest  #after eating, reset digesting counter
@@ -389,9 +683,7 @@ class NinjaAnt(Ant):
 
     def action(self, colony):
         # BEGIN Problem 7
-        for bee in self.place.bees[:]:
-            if self.place is bee.place:
-                bee.reduce_armor(self.damage)
+        self.place.damage_bees(self.damage)
         # END Problem 7
 
 #NOTE: As of 11:17 PM, 4/14/2021, everything runs as expected.  Phase 1 and 2 checkpoint submission.
@@ -463,13 +755,14 @@ class TankAnt(BodyguardAnt):
         #perform action of the body guard ant
         BodyguardAnt.action(self, colony)
         #also damage the bee in its place by self.damage (1)
-        for bee in self.place.bees[:]:
-            bee.reduce_armor(self.damage)
+        self.place.damage_bees(self.damage)
         # END Problem 10
 
 class Water(Place):
     """Water is a place that can only hold watersafe insects."""
-    
+
+    __slots__ = ()
+
     def add_insect(self, insect):
         """Add an Insect to this place. If the insect is not watersafe, reduce
         its armor to 0."""
@@ -522,6 +815,11 @@ class QueenAnt(ScubaThrower):  # You should change this line, change to a subcla
         """
         # BEGIN Problem 13
         self.armor -= amount
+        self._record_change()
+        if event_bus.active:
+            event_bus.emit('damage', self, amount)
+            if self.armor <= 0:
+                event_bus.emit('death', self, self.place)
         if self.armor <= 0:
             self.place.remove_insect(self)
             if self.is_imposter is False:
@@ -542,22 +840,32 @@ class QueenAnt(ScubaThrower):  # You should change this line, change to a subcla
         else:  
             ScubaThrower.action(self, colony)  #perform action of ScubaThrower
             #additionally, double the damage of all bees behind queen
-            place = self.place
-            while place:
-                place = place.exit  #track if there are places behind (exits) the queen
-                if not place:  #if there is no exit (i.e. a place to the left) break the loop, queen can't boost ants
-                    break
-                else:
-                    #power up the ants behind the queen, and put them into duplicate list
-                    if place.ant and place.ant not in self.duplicate_ants:
-                        place.ant.damage *= 2
-                        self.duplicate_ants.append(place.ant)
-                    #check if ant is a container, and power up the contained ants in the container, and put the ant in a duplicates list
-                    if place.ant and place.ant.is_container and place.ant.contained_ant not in self.duplicate_ants:  #if ant is a container, and if it contains an ant
-                        if place.ant.contained_ant:
-                            place.ant.contained_ant.damage *= 2
-                            self.duplicate_ants.append(place.ant.contained_ant)
+            for place in self.places_behind():
+                #power up the ants behind the queen, and put them into duplicate list
+                if place.ant and place.ant not in self.duplicate_ants:
+                    place.ant.damage *= 2
+                    self.duplicate_ants.append(place.ant)
+                    colony.record_change(place.ant, self)
+                #check if ant is a container, and power up the contained ants in the container, and put the ant in a duplicates list
+                if place.ant and place.ant.is_container and place.ant.contained_ant not in self.duplicate_ants:  #if ant is a container, and if it contains an ant
+                    if place.ant.contained_ant:
+                        place.ant.contained_ant.damage *= 2
+                        self.duplicate_ants.append(place.ant.contained_ant)
+                        colony.record_change(place.ant.contained_ant, self)
         # END Problem 13
+
+    def places_behind(self):
+        """Return the places reached by following exits from the queen's
+        place, nearest first."""
+        tunnel = self.place.tunnel
+        if tunnel is not None:
+            return tunnel.places[self.place.depth - 1::-1] if self.place.depth else []
+        places = []
+        place = self.place.exit
+        while place:
+            places.append(place)
+            place = place.exit
+        return places
 #NOTE: as of 6:21 PM, 5/15/2021, project is finished including extra credit
 
 class AntRemover(Ant):
@@ -575,6 +883,7 @@ class AntRemover(Ant):
 
 class Wasp(Bee):
     """Class of Bee that has higher damage."""
+    __slots__ = ()
     name = 'Wasp'
     damage = 2
 
@@ -582,6 +891,7 @@ class Hornet(Bee):
     """Class of bee that is capable of taking two actions per turn, although
     its overall damage output is lower. Immune to status effects.
     """
+    __slots__ = ()
     name = 'Hornet'
     damage = 0.25
 
@@ -598,6 +908,7 @@ class NinjaBee(Bee):
     """A Bee that cannot be blocked. Is capable of moving past all defenses to
     assassinate the Queen.
     """
+    __slots__ = ()
     name = 'NinjaBee'
 
     def blocked(self):
@@ -608,6 +919,7 @@ class Boss(Wasp, Hornet):
     status effect immunity of Hornets. Damage to the boss is capped up to 8
     damage by a single attack.
     """
+    __slots__ = ()
     name = 'Boss'
     damage_cap = 8
     action = Wasp.action
@@ -618,30 +930,152 @@ class Boss(Wasp, Hornet):
     def damage_modifier(self, amount):
         return amount * self.damage_cap/(self.damage_cap + amount)
 
+# The reduce_armor methods that Place.damage_bees applies in one pass
+_PLAIN_REDUCE_ARMOR = (Insect.reduce_armor, Boss.reduce_armor)
+
 class Hive(Place):
     """The Place from which the Bees launch their assault.
 
     assault_plan -- An AssaultPlan; when & where bees enter the colony.
     """
 
+    __slots__ = ('assault_plan',)
+
     def __init__(self, assault_plan):
         self.name = 'Hive'
         self.assault_plan = assault_plan
-        self.bees = []
+        self.bees = InsectList()
+        self.colony = None
+        self.id = None
         for bee in assault_plan.all_bees:
             self.add_insect(bee)
         # The following attributes are always None for a Hive
         self.entrance = None
         self.ant = None
         self.exit = None
+        self.tunnel = None
+        self.depth = None
 
     def strategy(self, colony):
-        exits = [p for p in colony.places.values() if p.entrance is self]
-        for bee in self.assault_plan.get(colony.time, []):
-            bee.move_to(random.choice(exits))
+        topology = colony.topology
+        for bee in self.assault_plan.release(colony.time):
+            if bee.place is None:  # Just created by a LazyAssaultPlan
+                self.add_insect(bee)
+            bee.move_to(topology.places[colony.rng.choice(topology.bee_entrances)])
             colony.active_bees.append(bee)
 
 
+def random_stream(seed=None):
+    """Return a random.Random seeded with SEED, or the global random module if
+    SEED is None. A colony seeded with SEED plays the same game as one that
+    shares the global module after random.seed(SEED).
+
+    >>> [random_stream(88).random() for _ in range(2)] == [random_stream(88).random()] * 2
+    True
+    """
+    if seed is None:
+        return random
+    return random.Random(seed)
+
+
+class Topology(object):
+    """The compiled layout of a colony, in which Places are numbered by id.
+
+    Ids follow the order in which places were registered, so the Hive is 0;
+    the QueenPlace takes the last id. Each list below is indexed by id and
+    holds -1 where the original attribute is None.
+
+    places -- A list of all Places, including the Hive and the QueenPlace
+    ids -- A dict from place names to ids
+    exits, entrances -- Lists of the ids of each Place's exit and entrance
+    water -- A list of booleans; True for Water places
+    tunnels -- A list of lists of ids, one for each tunnel, ordered from the
+               queen towards the Hive along entrances
+    tunnel, depth -- Lists of each Place's tunnel number and its index there
+    bee_entrances -- A list of the ids of places whose entrance is the Hive
+
+    >>> from ants_plans import AssaultPlan
+    >>> queen, hive = QueenPlace('AntQueen'), Hive(AssaultPlan())
+    >>> places = [hive]
+    >>> dry_layout(queen, lambda place, _: places.append(place), 2, 2)
+    >>> places[2].entrance = places[4].entrance = hive
+    >>> topology = Topology(places, queen)
+    >>> topology.ids['tunnel_1_0'], topology.exits[3], topology.tunnels
+    (3, 5, [[1, 2], [3, 4]])
+    >>> topology.depth[4], topology.bee_entrances
+    (1, [2, 4])
+    """
+
+    def __init__(self, places, queen):
+        self.places = places + [queen]
+        for i, place in enumerate(self.places):
+            place.id = i
+        self.ids = {place.name: place.id for place in places}
+        self.exits = [_place_id(p.exit) for p in self.places]
+        self.entrances = [_place_id(p.entrance) for p in self.places]
+        self.water = [isinstance(p, Water) for p in self.places]
+        self.bee_entrances = [p.id for p in places if p.entrance is places[0]]
+        self.tunnels = []
+        self.tunnel = [-1] * len(self.places)
+        self.depth = [-1] * len(self.places)
+        for place in places:
+            if place.exit is queen:
+                self._add_tunnel(place, places[0])
+
+    def _add_tunnel(self, place, hive):
+        """Add the tunnel of places reached from PLACE by following
+        entrances, if each of them exits to the one before."""
+        row = [place.id]
+        while place.entrance is not None and place.entrance is not hive:
+            if place.entrance.exit is not place:
+                return
+            place = place.entrance
+            row.append(place.id)
+        for depth, i in enumerate(row):
+            self.tunnel[i] = len(self.tunnels)
+            self.depth[i] = depth
+        self.tunnels.append(row)
+
+def _place_id(place):
+    return -1 if place is None else place.id
+
+
+class Tunnel(object):
+    """A Tunnel is the chain of Places reached by following entrances from
+    the queen towards the Hive. It keeps the depths of its Places that hold
+    Bees in sorted order.
+
+    >>> tunnel = Tunnel([Place('a'), Place('b'), Place('c'), Place('d')])
+    >>> tunnel.add_bee_depth(1)
+    >>> tunnel.add_bee_depth(3)
+    >>> tunnel.nearest_bee_place(0, 2, float('inf')).name
+    'd'
+    >>> tunnel.nearest_bee_place(0, 0, 1) is None
+    True
+    """
+
+    def __init__(self, places):
+        self.places = places   # Places by depth, starting next to the queen
+        self.bee_depths = []   # Sorted depths of the Places that hold Bees
+        for depth, place in enumerate(places):
+            place.tunnel = self
+            place.depth = depth
+
+    def add_bee_depth(self, depth):
+        insort(self.bee_depths, depth)
+
+    def remove_bee_depth(self, depth):
+        del self.bee_depths[bisect_left(self.bee_depths, depth)]
+
+    def nearest_bee_place(self, depth, min_range, max_range):
+        """Return the Place nearest to DEPTH, towards the Hive, that holds
+        Bees and is between MIN_RANGE (inclusive) and MAX_RANGE (exclusive)
+        entrances away, or None if there is no such Place."""
+        i = bisect_left(self.bee_depths, depth + min_range)
+        if i < len(self.bee_depths) and self.bee_depths[i] - depth < max_range:
+            return self.places[self.bee_depths[i]]
+
+
 class AntColony(object):
     """An ant collective that manages global game state and simulates time.
 
@@ -650,9 +1084,13 @@ class AntColony(object):
     food -- the colony's available food total
     places -- A list of all places in the colony (including a Hive)
     bee_entrances -- A list of places that bees can enter
+    topology -- The Topology compiled from the places
+    tunnels -- A list of Tunnels, one for each tunnel of the Topology
+    rng -- The source of every random choice in the game
     """
 
-    def __init__(self, strategy, beehive, ant_types, create_places, dimensions, food=2):
+    def __init__(self, strategy, beehive, ant_types, create_places, dimensions,
+                 food=2, seed=None):
         """Create an AntColony for simulating a game.
 
         Arguments:
@@ -661,14 +1099,17 @@ class AntColony(object):
         ant_types -- a list of ant constructors
         create_places -- a function that creates the set of places
         dimensions -- a pair containing the dimensions of the game layout
+        seed -- seeds a random stream of the colony's own, or None to share
+                the global random module
         """
         self.time = 0
         self.food = food
+        self.rng = random_stream(seed)
         self.strategy = strategy
         self.beehive = beehive
         self.ant_types = OrderedDict((a.name, a) for a in ant_types)
         self.dimensions = dimensions
-        self.active_bees = []
+        self.active_bees = InsectList()
         self.configure(beehive, create_places)
 
     def configure(self, beehive, create_places):
@@ -676,72 +1117,329 @@ class AntColony(object):
         self.base = QueenPlace('AntQueen')
         self.places = OrderedDict()
         self.bee_entrances = []
+        self._place_ants = {}    # Place -> the Ant in that Place
+        self._bee_places = {}    # Places that hold at least one Bee
+        self._num_placed_bees = 0
+        self._ants = self._bees = None  # Cached results of ants and bees
+        self.state = None        # The State of snapshots, made by the first
+        self._touched = None     # Places changed since the last snapshot
+        self._changed = None     # Insects changed since the last snapshot
         def register_place(place, is_bee_entrance):
             self.places[place.name] = place
+            place.id = len(self.places) - 1
+            place.colony = self
+            if place.ant is not None:
+                self.update_index(place, place.ant)
+            if place.bees:
+                self._bee_places[place] = True
+                self._num_placed_bees += len(place.bees)
             if is_bee_entrance:
                 place.entrance = beehive
                 self.bee_entrances.append(place)
         register_place(self.beehive, False)
         create_places(self.base, register_place, self.dimensions[0], self.dimensions[1])
-
-    def simulate(self):
-        """Simulate an attack on the ant colony (i.e., play the game)."""
-        num_bees = len(self.bees)
+        self.topology = Topology(list(self.places.values()), self.base)
+        places = self.topology.places
+        self.tunnels = [Tunnel([places[i] for i in row]) for row in self.topology.tunnels]
+        for place in self._bee_places:
+            if place.tunnel is not None:
+                place.tunnel.add_bee_depth(place.depth)
+
+    def simulate(self, profiler=None):
+        """Simulate an attack on the ant colony (i.e., play the game).
+
+        If PROFILER is given, such as an ants_profile.TurnProfiler, each turn
+        is played by its take_turn method so that it can time the phases.
+        """
+        turns = self.turns(profiler)
+        while True:
+            try:
+                next(turns)
+            except StopIteration as end:
+                return end.value
+
+    def turns(self, profiler=None):
+        """Return a generator that plays one turn of the game each time it is
+        advanced, and returns True if the ants win or False if they lose.
+        Drivers such as ants_loop.GameLoop use it to pace the game."""
+        take_turn = self.take_turn
+        if profiler is not None:
+            take_turn = lambda: profiler.take_turn(self)
         try:
             while True:
-                self.strategy(self)                 # Ants deploy
-                self.beehive.strategy(self)            # Bees invade
-                for ant in self.ants:               # Ants take actions
-                    if ant.armor > 0:
-                        ant.action(self)
-                for bee in self.active_bees[:]:     # Bees take actions
-                    if bee.armor > 0:
-                        bee.action(self)
-                    if bee.armor <= 0:
-                        num_bees -= 1
-                        self.active_bees.remove(bee)
-                if num_bees == 0:
+                take_turn()
+                if event_bus.active:
+                    event_bus.emit('turn', self)
+                # Expired bees stay active until their own action is over
+                if self.num_bees == 0 and not self.active_bees:
                     raise AntsWinException()
                 self.time += 1
+                yield
         except AntsWinException:
             print('All bees are vanquished. You win!')
             return True
         except BeesWinException:
             print('The ant queen has perished. Please try again.')
             return False
+        finally:
+            if event_bus.active:
+                event_bus.emit('end', self)
+
+    def take_turn(self):
+        """Play the four phases of one turn."""
+        self.ants_deploy()
+        self.bees_invade()
+        self.ants_take_actions()
+        self.bees_take_actions()
+
+    def ants_deploy(self):
+        """The first phase of a turn, in which the strategy deploys ants."""
+        self.strategy(self)
+
+    def bees_invade(self):
+        """The second phase of a turn, in which the Hive releases bees."""
+        self.beehive.strategy(self)
+
+    def ants_take_actions(self, act=None):
+        """The third phase of a turn, in which each living ant takes its
+        action. If ACT is given, each action is taken by calling ACT(ant)
+        instead, as ants_profile does to time the actions."""
+        for ant in self.ants:
+            if ant.armor > 0:
+                if act is None:
+                    ant.action(self)
+                else:
+                    act(ant)
+
+    def bees_take_actions(self, act=None):
+        """The last phase of a turn, in which each active bee takes its
+        action, and expired bees stop being active. ACT is used as in
+        ants_take_actions."""
+        for bee in self.active_bees[:]:
+            if bee.armor > 0:
+                if act is None:
+                    bee.action(self)
+                else:
+                    act(bee)
+            if bee.armor <= 0:
+                self.active_bees.remove(bee)
 
     def deploy_ant(self, place_name, ant_type_name):
         """Place an ant if enough food is available.
 
         This method is called by the current strategy to deploy ants.
         """
+        return self.deploy_ant_at(self.topology.ids[place_name], ant_type_name)
+
+    def deploy_ant_at(self, place_id, ant_type_name):
+        """Place an ant in the place numbered PLACE_ID if enough food is
+        available."""
         constructor = self.ant_types[ant_type_name]
         if self.food < constructor.food_cost:
             print('Not enough food remains to place ' + ant_type_name)
         else:
             ant = constructor()
-            self.places[place_name].add_insect(ant)
+            place = self.topology.places[place_id]
+            place.add_insect(ant)
             self.food -= constructor.food_cost
+            if event_bus.active:
+                event_bus.emit('deploy', ant, place)
             return ant
 
     def remove_ant(self, place_name):
         """Remove an Ant from the Colony."""
-        place = self.places[place_name]
-        if place.ant is not None:
-            place.remove_insect(place.ant)
+        self.remove_ant_at(self.topology.ids[place_name])
+
+    def remove_ant_at(self, place_id):
+        """Remove the Ant in the place numbered PLACE_ID."""
+        place = self.topology.places[place_id]
+        ant = place.ant
+        if ant is not None:
+            place.remove_insect(ant)
+            if event_bus.active:
+                event_bus.emit('remove', ant, place)
+
+    def update_index(self, place, insect):
+        """Update the ant and bee indexes after INSECT entered or left PLACE.
+
+        This method is called by Place.add_insect and Place.remove_insect.
+        """
+        if self._touched is not None:
+            self._touched.add(place)
+            self._changed.add(insect)
+            if place.ant is not None:  # Perhaps the container of INSECT
+                self._changed.add(place.ant)
+        if insect.is_ant:
+            if place.ant is None:
+                self._place_ants.pop(place, None)
+            else:
+                self._place_ants[place] = place.ant
+            self._ants = None
+        else:
+            self._num_placed_bees += 1 if insect.place is place else -1
+            if place.bees and place not in self._bee_places:
+                self._bee_places[place] = True
+                if place.tunnel is not None:
+                    place.tunnel.add_bee_depth(place.depth)
+            elif not place.bees and place in self._bee_places:
+                del self._bee_places[place]
+                if place.tunnel is not None:
+                    place.tunnel.remove_bee_depth(place.depth)
+            self._bees = None
+
+    def record_change(self, *insects):
+        """Store INSECTS in the next snapshot, after a change to their armor
+        or attributes that did not move them between places."""
+        if self._changed is not None:
+            self._changed.update(insects)
 
     @property
     def ants(self):
-        return [p.ant for p in self.places.values() if p.ant is not None]
+        """The Ants in all places, in the order of places.
+
+        The list is shared until an Ant enters or leaves a place, so it must
+        not be modified.
+        """
+        if self._ants is None:
+            places = sorted(self._place_ants, key=attrgetter('id'))
+            self._ants = [self._place_ants[p] for p in places]
+        return self._ants
 
     @property
     def bees(self):
-        return [b for p in self.places.values() for b in p.bees]
+        """The Bees in all places, in the order of places.
+
+        The list is shared until a Bee enters or leaves a place, so it must
+        not be modified. Bees that a LazyAssaultPlan has yet to create are
+        not in any place; num_bees counts them, and ants_batch lists them
+        among the surviving bees of a game.
+        """
+        if self._bees is None:
+            places = sorted(self._bee_places, key=attrgetter('id'))
+            self._bees = [b for p in places for b in p.bees]
+        return self._bees
+
+    @property
+    def num_bees(self):
+        """The number of Bees in all places, plus those that the assault plan
+        has yet to create."""
+        return self._num_placed_bees + self.beehive.assault_plan.num_pending
 
     @property
     def insects(self):
         return self.ants + self.bees
 
+    def snapshot(self):
+        """Commit the game to self.state and return its version number, which
+        restore accepts. Only the places and insects that changed since the
+        last snapshot are stored; everything else is shared with it.
+
+        >>> from ants_plans import make_test_assault_plan
+        >>> colony = AntColony(None, Hive(make_test_assault_plan()), ant_types(),
+        ...                    dry_layout, (1, 9), food=4, seed=1)
+        >>> start = colony.snapshot()
+        >>> thrower = colony.deploy_ant('tunnel_0_0', 'Thrower')
+        >>> colony.time, colony.food = 5, 1
+        >>> thrower.reduce_armor(1)
+        >>> colony.restore(start)
+        >>> colony.food, colony.ants
+        (4, [])
+        """
+        if self.state is None:
+            self.state = State()
+            self._touched = set(self.topology.places)
+            self._changed = set()
+            for place in self._touched:
+                if place.ant is not None:
+                    self._changed.add(place.ant)
+                    contained = getattr(place.ant, 'contained_ant', None)
+                    if contained is not None:
+                        self._changed.add(contained)
+                self._changed.update(place.bees)
+        self._record()
+        return self.state.commit()
+
+    def restore(self, version):
+        """Return the game to a VERSION returned by snapshot. Snapshots taken
+        after restoring fork from VERSION, and every earlier version remains
+        available.
+
+        An ant that dies after its container is restored along with it.
+
+        >>> from ants_plans import make_test_assault_plan, idle_strategy
+        >>> colony = AntColony(idle_strategy, Hive(make_test_assault_plan()),
+        ...                    ant_types(), dry_layout, (1, 9), food=10, seed=1)
+        >>> thrower = colony.deploy_ant('tunnel_0_0', 'Thrower')
+        >>> guard = colony.deploy_ant('tunnel_0_0', 'Bodyguard')
+        >>> start = colony.snapshot()
+        >>> guard.reduce_armor(2)
+        >>> thrower.reduce_armor(1)
+        >>> end = colony.snapshot()
+        >>> colony.restore(start)
+        >>> colony.ants, guard.contained_ant
+        ([BodyguardAnt(2, tunnel_0_0)], ThrowerAnt(1, tunnel_0_0))
+        >>> colony.take_turn()
+        """
+        self._record()
+        changes = self.state.checkout(version)
+        places = []
+        for key, value in changes.items():
+            if value is MISSING:
+                continue  # Created after VERSION, so it is not in any place
+            if key is self:
+                (self.time, self.food, active_bees, self._num_placed_bees,
+                 QueenAnt.queen_status, rng_state, plan_state) = value
+                self.active_bees = InsectList(active_bees)
+                self.rng.setstate(rng_state)
+                self.beehive.assault_plan.restore(plan_state)
+            elif isinstance(key, Place):
+                key.ant, bees = value
+                key.bees = InsectList(bees)
+                places.append(key)
+            else:
+                key.armor, key.place, attributes = value
+                if attributes is not None:
+                    key.__dict__.clear()
+                    for name, val in attributes.items():
+                        setattr(key, name, list(val) if type(val) is list else val)
+        for place in places:
+            if place.ant is None:
+                self._place_ants.pop(place, None)
+            else:
+                self._place_ants[place] = place.ant
+            if place.bees and place not in self._bee_places:
+                self._bee_places[place] = True
+                if place.tunnel is not None:
+                    place.tunnel.add_bee_depth(place.depth)
+            elif not place.bees and place in self._bee_places:
+                del self._bee_places[place]
+                if place.tunnel is not None:
+                    place.tunnel.remove_bee_depth(place.depth)
+        self._ants = self._bees = None
+
+    def _record(self):
+        """Update self.state with the places and insects changed since the
+        last snapshot."""
+        state, gs = self.state, self.state.gs
+        for place in self._touched:
+            value = (place.ant, tuple(place.bees))
+            if gs.get(place) != value:
+                state.updateState(place, value)
+        for insect in self._changed:
+            attributes = getattr(insect, '__dict__', None)  # None for Bees
+            if attributes is not None:
+                attributes = {name: list(val) if type(val) is list else val
+                              for name, val in attributes.items()}
+            value = (insect.armor, insect.place, attributes)
+            if gs.get(insect) != value:
+                state.updateState(insect, value)
+        self._touched, self._changed = set(), set()
+        value = (self.time, self.food, tuple(self.active_bees),
+                 self._num_placed_bees, QueenAnt.queen_status,
+                 self.rng.getstate(), self.beehive.assault_plan.save())
+        if gs.get(self) != value:
+            state.updateState(self, value)
+
     def __str__(self):
         status = ' (Food: {0}, Time: {1})'.format(self.food, self.time)
         return str([str(i) for i in self.ants + self.bees]) + status
@@ -749,6 +1447,8 @@ class AntColony(object):
 class QueenPlace(Place):
     """QueenPlace at the end of the tunnel, where the queen resides."""
 
+    __slots__ = ()
+
     def add_insect(self, insect):
         """Add an Insect to this Place.
 
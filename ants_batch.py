@@ -0,0 +1,191 @@
+"""Headless batch simulation of many Ants Vs. SomeBees games.
+
+Each game is described by a GameConfig and played silently in a worker
+process. Results are streamed back as GameResult records as games finish:
+
+>>> from ants_plans import make_test_assault_plan
+>>> config = GameConfig(make_test_assault_plan, dry_layout, (1, 9), seed=0)
+>>> result = play_game(config)
+>>> result.winner, result.time, result.food
+('bees', 10, 2)
+
+Bees that a LazyAssaultPlan has yet to create are listed among the survivors
+in the Hive, as those of an AssaultPlan are, so both kinds of plan give the
+same result:
+
+>>> from ants_plans import make_normal_assault_plan
+>>> eager = GameConfig(make_normal_assault_plan, dry_layout, (1, 9), seed=0)
+>>> lazy = eager._replace(assault_plan=lambda: make_normal_assault_plan(True))
+>>> play_game(lazy) == play_game(eager)
+True
+
+Surviving ants include those inside container ants:
+
+>>> def guarded(colony):
+...     if colony.time == 0:
+...         colony.deploy_ant('tunnel_0_0', 'Thrower')
+...         colony.deploy_ant('tunnel_0_0', 'Bodyguard')
+>>> play_game(config._replace(food=7, strategy=guarded)).ants
+[('Bodyguard', 2, 'tunnel_0_0'), ('Thrower', 1, 'tunnel_0_0')]
+"""
+
+import contextlib
+import multiprocessing
+import os
+import random
+from collections import namedtuple
+
+from ants import *
+
+GameConfig = namedtuple('GameConfig', ['assault_plan', 'layout', 'dimensions',
+                                       'food', 'strategy', 'seed', 'engine'])
+GameConfig.__new__.__defaults__ = (2, None, None, None)
+GameConfig.__doc__ = """The inputs of one game.
+
+assault_plan -- a function that returns a new AssaultPlan
+layout -- a layout function such as wet_layout or dry_layout
+dimensions -- a (tunnels, length) pair
+food -- the colony's starting food
+strategy -- a function to deploy ants to places (defaults to idle_strategy)
+seed -- the random seed of the game (None for an unseeded game)
+engine -- the colony class that plays the game: AntColony (the default) or
+          ants_numpy.ArrayColony, which plays the same game faster on big boards
+"""
+
+GameResult = namedtuple('GameResult', ['index', 'winner', 'time', 'food',
+                                       'ants', 'bees'])
+GameResult.__doc__ = """The outcome of one game.
+
+index -- the position of the game's config in the batch
+winner -- 'ants' or 'bees'
+time -- the turn on which the game ended
+food -- the colony's food when the game ended
+ants -- a list of (name, armor, place name) triples for surviving ants,
+        each container ant followed by the ant it contains
+bees -- a list of (name, armor, place name) triples for surviving bees,
+        including those that a LazyAssaultPlan has yet to create, which are
+        listed in the Hive as those of an AssaultPlan are
+"""
+
+
+def play_game(config, index=0):
+    """Play the game described by CONFIG without printing and return its
+    GameResult."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        colony = make_colony(config)
+        ants_won = colony.simulate()
+    if isinstance(colony, AntColony):
+        ants = _survivors(_with_contained(colony.ants))
+        bees = _pending(colony.beehive) + _survivors(colony.bees)
+    else:
+        ants, bees = colony.survivors()
+    return GameResult(index, 'ants' if ants_won else 'bees', colony.time,
+                      colony.food, ants, bees)
+
+def make_colony(config):
+    """Return a new colony for the game described by CONFIG, with a random
+    stream of its own if the config has a seed."""
+    QueenAnt.queen_status = False  # Every game gets its own true queen
+    strategy = config.strategy
+    if strategy is None:
+        from ants_plans import idle_strategy
+        strategy = idle_strategy
+    beehive = Hive(config.assault_plan())
+    engine = config.engine or AntColony
+    return engine(strategy, beehive, ant_types(), config.layout,
+                  config.dimensions, config.food, config.seed)
+
+def _survivors(insects):
+    return [(i.name, i.armor, i.place.name) for i in insects if i.place]
+
+def _with_contained(ants):
+    """Yield each of ANTS, followed by the ant it contains if it is a
+    container ant."""
+    for ant in ants:
+        yield ant
+        if ant.is_container and ant.contained_ant is not None:
+            yield ant.contained_ant
+
+def _pending(hive):
+    """Return (name, armor, place name) triples for the bees that the assault
+    plan of HIVE has yet to create, placed in HIVE. The pending bees of an
+    unbounded plan cannot be listed, so none are returned for it."""
+    plan = hive.assault_plan
+    if not plan.num_pending or plan.num_pending == float('inf'):
+        return []
+    return [(bee_type.name, armor, hive.name)
+            for _, bee_type, armor in plan.descriptors()]
+
+def _play_indexed(indexed_config):
+    index, config = indexed_config
+    return play_game(config, index)
+
+def child_seeds(seed, count):
+    """Return a list of COUNT seeds for independent random streams, all
+    derived from SEED.
+
+    >>> child_seeds(88, 3) == child_seeds(88, 3)
+    True
+    >>> len(set(child_seeds(88, 3)))
+    3
+    """
+    root = random.Random(seed)
+    return [root.getrandbits(64) for _ in range(count)]
+
+def seed_configs(configs, seed):
+    """Return a list of CONFIGS in which each unseeded config is given a child
+    seed of SEED, taken in order, so that the batch can be reproduced."""
+    configs = list(configs)
+    seeds = child_seeds(seed, len(configs))
+    return [c if c.seed is not None else c._replace(seed=s)
+            for c, s in zip(configs, seeds)]
+
+def simulate_batch(configs, workers=None, chunksize=1, seed=None, cache=None):
+    """Play every GameConfig in CONFIGS across a pool of WORKERS processes and
+    yield a GameResult for each game as soon as it finishes.
+
+    Results may arrive out of order; each carries the index of its config.
+    With workers=1, games are played one at a time in this process. Config
+    functions (assault plans, layouts and strategies) must be defined at the
+    top level of a module so that they can be sent to worker processes.
+
+    Every game draws from its own random stream, so results do not depend on
+    which worker plays a game. If SEED is given, unseeded configs are seeded
+    with child_seeds(SEED, ...).
+
+    If CACHE, an ants_cache.GameCache, is given, cached results are yielded
+    first and only the other games are played, then added to the cache.
+    """
+    if seed is not None:
+        configs = seed_configs(configs, seed)
+    indexed = enumerate(configs)
+    keys = {}
+    if cache is not None:
+        from ants_cache import fingerprint
+        missing = []
+        for index, config in indexed:
+            key = fingerprint(config)
+            result = cache.get(key, index) if key else None
+            if result is None:
+                keys[index] = key
+                missing.append((index, config))
+            else:
+                yield result
+        indexed = missing
+    try:
+        for result in _play_all(indexed, workers, chunksize):
+            if keys.get(result.index):
+                cache.put(keys[result.index], result)
+            yield result
+    finally:
+        if cache is not None:
+            cache.commit()
+
+def _play_all(indexed, workers, chunksize):
+    if workers == 1:
+        for indexed_config in indexed:
+            yield _play_indexed(indexed_config)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(_play_indexed, indexed, chunksize):
+            yield result
@@ -0,0 +1,181 @@
+"""Benchmarks for Ants Vs. SomeBees.
+
+Run this module to print the results:
+
+    python3 ants_bench.py
+
+The simulation benchmarks play every assault plan on wet and dry layouts of
+several sizes, with fixed deployment scripts. Save their results to compare
+two revisions and flag regressions:
+
+    python3 ants_bench.py --save before.json
+    (check out the other revision)
+    python3 ants_bench.py --compare before.json
+"""
+
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from ants import *
+from ants_batch import GameConfig, make_colony
+from ants_plans import *
+from ucb import main
+
+####################
+# Memory Benchmark #
+####################
+
+class DictBee(Bee):
+    """A Bee with a per-instance __dict__, as every Bee had before Insects
+    used __slots__."""
+
+class DictPlace(Place):
+    """A Place with a per-instance __dict__, as every Place had before Places
+    used __slots__."""
+
+def bytes_per_bee(bee_type, count=100000):
+    """Return the bytes allocated per Bee by an AssaultPlan wave of COUNT
+    Bees of BEE_TYPE."""
+    tracemalloc.start()
+    plan = AssaultPlan().add_wave(bee_type, 3, 1, count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / count
+
+def bytes_per_place(place_type, count=100000):
+    """Return the bytes allocated per Place for a tunnel of COUNT Places of
+    PLACE_TYPE."""
+    tracemalloc.start()
+    exit = None
+    for step in range(count):
+        exit = place_type('tunnel_0_{0}'.format(step), exit)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / count
+
+def memory_benchmark():
+    """Return a dict of bytes per Bee and per Place, with and without
+    __slots__."""
+    return {'bytes_per_bee': {'dict': bytes_per_bee(DictBee),
+                              'slots': bytes_per_bee(Bee)},
+            'bytes_per_place': {'dict': bytes_per_place(DictPlace),
+                                'slots': bytes_per_place(Place)}}
+
+#########################
+# Simulation Benchmarks #
+#########################
+
+PLANS = OrderedDict([('test', make_test_assault_plan),
+                     ('easy', make_easy_assault_plan),
+                     ('normal', make_normal_assault_plan),
+                     ('hard', make_hard_assault_plan),
+                     ('extra-hard', make_extra_hard_assault_plan)])
+LAYOUTS = OrderedDict([('dry', (dry_layout, 0)), ('wet', (wet_layout, 3))])
+SCALES = OrderedDict([('small', (3, 9)), ('medium', (10, 30)), ('large', (40, 60))])
+SCRIPTS = OrderedDict([('idle', None), ('throwers', thrower_script),
+                       ('mixed', mixed_script)])
+
+def benchmark_cases(quick=False):
+    """Yield a (name, GameConfig) pair for every simulation benchmark. Quick
+    runs skip the large scale."""
+    for plan_name, plan in PLANS.items():
+        for layout_name, (layout, moat_frequency) in LAYOUTS.items():
+            for scale_name, dimensions in SCALES.items():
+                if quick and scale_name == 'large':
+                    continue
+                for script_name, script in SCRIPTS.items():
+                    strategy = idle_strategy
+                    if script is not None:
+                        strategy = ScriptedStrategy(script(*dimensions, moat_frequency))
+                    name = '/'.join([plan_name, layout_name, scale_name, script_name])
+                    food = 4 * dimensions[0]
+                    yield name, GameConfig(plan, layout, dimensions, food, strategy, 0)
+
+def time_case(config, repeats=5):
+    """Play the game of CONFIG REPEATS times and return a dict of its speed
+    and the peak memory allocated while playing it once more."""
+    turns, seconds = 0, 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeats):
+            colony = make_colony(config)
+            start = time.perf_counter()
+            colony.simulate()
+            seconds += time.perf_counter() - start
+            turns += colony.time + 1
+        tracemalloc.start()
+        make_colony(config).simulate()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'games': repeats, 'turns': turns, 'seconds': seconds,
+            'turns_per_sec': turns / seconds, 'games_per_sec': repeats / seconds,
+            'peak_memory': peak_memory}
+
+def run_benchmarks(quick=False, repeats=5):
+    """Return the results of every benchmark as a JSON-compatible dict."""
+    cases = OrderedDict((name, time_case(config, repeats))
+                        for name, config in benchmark_cases(quick))
+    return {'cases': cases, 'memory': memory_benchmark()}
+
+def compare(old, new, tolerance=0.1):
+    """Return a list of messages describing each case of the results NEW that
+    is more than TOLERANCE (a fraction) slower or larger than in OLD."""
+    regressions = []
+    for name, result in new['cases'].items():
+        if name not in old['cases']:
+            continue
+        before = old['cases'][name]
+        if result['turns_per_sec'] < before['turns_per_sec'] * (1 - tolerance):
+            regressions.append('{0}: {1:.0f} turns/sec, was {2:.0f}'.format(
+                name, result['turns_per_sec'], before['turns_per_sec']))
+        if result['peak_memory'] > before['peak_memory'] * (1 + tolerance):
+            regressions.append('{0}: peak memory {1} bytes, was {2}'.format(
+                name, result['peak_memory'], before['peak_memory']))
+    return regressions
+
+def print_results(results):
+    for name, result in results['cases'].items():
+        print('{0:40} {1:9.0f} turns/sec {2:8.1f} games/sec {3:9} bytes peak'.format(
+            name, result['turns_per_sec'], result['games_per_sec'],
+            result['peak_memory']))
+    for name, sizes in results['memory'].items():
+        print('{0}: {1:.0f} with __dict__, {2:.0f} with __slots__'.format(
+            name, sizes['dict'], sizes['slots']))
+
+@main
+def run(*args):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark Ants vs. SomeBees")
+    parser.add_argument('--quick', action='store_true',
+                        help='skip the large boards')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='number of timed games per case')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results to FILE as JSON')
+    parser.add_argument('--compare', metavar='FILE', nargs='+',
+                        help='flag regressions against the results in FILE '
+                             '(of this run, or of a second FILE)')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown fraction reported as a regression')
+    args = parser.parse_args(list(args))
+
+    if args.compare and len(args.compare) > 1:
+        with open(args.compare[1]) as f:
+            results = json.load(f)
+    else:
+        results = run_benchmarks(args.quick, args.repeats)
+        print_results(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare[0]) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for message in regressions:
+            print('REGRESSION ' + message)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,215 @@
+"""A persistent cache of Ants Vs. SomeBees game results.
+
+GameCache stores the GameResult of each game in an SQLite database, keyed by
+a fingerprint of everything that decides the game: the contents of its
+assault plan, its layout and dimensions, starting food, the roster of ant
+types with their stats, its strategy and its seed. Pass a GameCache to
+ants_batch.simulate_batch to skip the games that were played before:
+
+>>> import os, tempfile
+>>> from ants_batch import GameConfig, simulate_batch
+>>> from ants_plans import make_test_assault_plan
+>>> cache = GameCache(os.path.join(tempfile.mkdtemp(), 'games.db'))
+>>> configs = [GameConfig(make_test_assault_plan, dry_layout, (1, 9), seed=s)
+...            for s in range(3)]
+>>> first = sorted(simulate_batch(configs, workers=1, cache=cache))
+>>> second = sorted(simulate_batch(configs, workers=1, cache=cache))
+>>> first == second
+True
+>>> cache.hits, cache.misses
+(3, 3)
+
+The database is cleared whenever the class attributes of the insects in
+ants.py change, since cached games may no longer be played the same way.
+Games without a seed, or whose strategy has no stable identity, are never
+cached.
+"""
+
+import hashlib
+import json
+import sqlite3
+import types
+
+from ants import *
+from ants_batch import GameResult
+
+######################
+# Game Fingerprints #
+######################
+
+def _class_key(cls):
+    """Return the data attributes and __init__ defaults of CLS, which is all
+    that distinguishes one insect class from another besides its code."""
+    attributes = []
+    for name, value in sorted(vars(cls).items()):
+        if name.startswith('__') or callable(value) or isinstance(value, property):
+            continue
+        attributes.append((name, repr(value)))
+    init = vars(cls).get('__init__')
+    defaults = repr(getattr(init, '__defaults__', None))
+    return [cls.__module__, cls.__qualname__, attributes, defaults]
+
+def rules_fingerprint():
+    """Return a fingerprint of every Insect class of ants.py and its
+    attributes. Subclasses defined elsewhere, such as those of ants_bench,
+    are left out, so importing them keeps the cache.
+
+    >>> before = rules_fingerprint()
+    >>> import ants_bench
+    >>> rules_fingerprint() == before
+    True
+    """
+    classes, new = [], [Insect]
+    while new:
+        classes.extend(new)
+        new = [sub for cls in new for sub in cls.__subclasses__()]
+    keys = sorted(_class_key(cls) for cls in set(classes)
+                  if cls.__module__ == Insect.__module__)
+    return _digest(keys)
+
+def function_key(fn):
+    """Return the module and name of a top-level function FN, or None."""
+    if isinstance(fn, types.FunctionType) and '<' not in fn.__qualname__:
+        return [fn.__module__, fn.__qualname__]
+
+def strategy_key(strategy):
+    """Return a stable identity for STRATEGY, or None if it has none.
+
+    A strategy object may define a cache_key attribute; top-level functions
+    are identified by name."""
+    if strategy is None:
+        return 'idle'
+    key = getattr(strategy, 'cache_key', None)
+    if key is not None:
+        return key
+    return function_key(strategy)
+
+def fingerprint(config):
+    """Return a hex digest that identifies the game of CONFIG, or None if the
+    game cannot be cached. The engine and the kind of assault plan are part
+    of the game, so their results are kept apart:
+
+    >>> from ants_batch import GameConfig
+    >>> from ants_numpy import ArrayColony
+    >>> from ants_plans import make_test_assault_plan
+    >>> config = GameConfig(make_test_assault_plan, dry_layout, (1, 9), seed=0)
+    >>> fingerprint(config) == fingerprint(config._replace(engine=AntColony))
+    True
+    >>> fingerprint(config) == fingerprint(config._replace(engine=ArrayColony))
+    False
+    >>> lazy = config._replace(assault_plan=lambda: make_test_assault_plan(True))
+    >>> fingerprint(config) == fingerprint(lazy)
+    False
+    """
+    strategy = strategy_key(config.strategy)
+    layout = function_key(config.layout)
+    if config.seed is None or strategy is None or layout is None:
+        return None
+    assault_plan = config.assault_plan()
+    try:
+        plan = [(time, bee_type.__qualname__, armor)
+                for time, bee_type, armor in assault_plan.descriptors()]
+    except ValueError:
+        return None  # An unbounded plan
+    plan_type = type(assault_plan)
+    engine = None
+    if config.engine not in (None, AntColony):
+        engine = [config.engine.__module__, config.engine.__qualname__]
+    roster = [_class_key(ant_type) for ant_type in ant_types()]
+    return _digest([plan, [plan_type.__module__, plan_type.__qualname__],
+                    engine, layout, list(config.dimensions), config.food,
+                    roster, strategy, config.seed])
+
+def _digest(data):
+    text = json.dumps(data, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+#########
+# Cache #
+#########
+
+class GameCache(object):
+    """An SQLite cache of GameResults that evicts the least recently used
+    results beyond MAX_ENTRIES.
+
+    Attributes:
+    hits, misses -- lookups that found or did not find a result
+    evictions -- results removed to stay within MAX_ENTRIES
+    """
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = self.misses = self.evictions = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta '
+                        '(name TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                        '(key TEXT PRIMARY KEY, result TEXT, used INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        rules = rules_fingerprint()
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'rules'").fetchone()
+        if row is None or row[0] != rules:
+            self.clear()
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('rules', ?)", (rules,))
+        self.db.commit()
+        self._clock = self.db.execute('SELECT MAX(used) FROM results').fetchone()[0] or 0
+        self._count = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def get(self, key, index=0):
+        """Return the cached GameResult for KEY with the given INDEX, or
+        None."""
+        row = self.db.execute('SELECT result FROM results WHERE key = ?',
+                              (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute('UPDATE results SET used = ? WHERE key = ?',
+                        (self._tick(), key))
+        winner, time, food, ants, bees = json.loads(row[0])
+        return GameResult(index, winner, time, food,
+                          [tuple(a) for a in ants], [tuple(b) for b in bees])
+
+    def put(self, key, result):
+        """Store RESULT under KEY, evicting old results if the cache is full."""
+        value, used = json.dumps(result[1:]), self._tick()
+        updated = self.db.execute('UPDATE results SET result = ?, used = ? '
+                                  'WHERE key = ?', (value, used, key))
+        if updated.rowcount:
+            return  # Replaced, so the count is the same
+        self.db.execute('INSERT INTO results VALUES (?, ?, ?)', (key, value, used))
+        self._count += 1
+        if self._count > self.max_entries:
+            excess = self._count - self.max_entries
+            deleted = self.db.execute('DELETE FROM results WHERE key IN (SELECT '
+                                      'key FROM results ORDER BY used LIMIT ?)',
+                                      (excess,))
+            self._count -= deleted.rowcount
+            self.evictions += deleted.rowcount
+
+    def commit(self):
+        self.db.commit()
+
+    def clear(self):
+        """Remove every result."""
+        self.db.execute('DELETE FROM results')
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        """Return a dict of the cache's size and hit/miss statistics."""
+        lookups = self.hits + self.misses
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0}
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,229 @@
+"""An evolutionary optimizer for Ants Vs. SomeBees deployment schedules.
+
+A schedule is a list of (time, tunnel, step, ant_type_name) entries, as
+played by ants_plans.ScriptedStrategy. evolve breeds a population of
+schedules against one assault plan and layout, playing every schedule under
+several seeds with ants_batch.simulate_batch. Fitness is memoized by
+schedule, so elites and duplicates are never played twice:
+
+>>> from ants_plans import make_test_assault_plan
+>>> problem = Problem(make_test_assault_plan, dry_layout, (1, 9), food=4,
+...                   seeds=(0, 1))
+>>> result = evolve(problem, population=8, generations=3, seed=0, workers=1)
+>>> result.win_rate
+1.0
+>>> len(result.history)
+3
+"""
+
+import random
+from collections import namedtuple
+
+from ants import *
+from ants_batch import GameConfig, simulate_batch
+from ants_plans import ScriptedStrategy
+from ucb import main
+
+WIN_FITNESS = 1000
+
+Problem = namedtuple('Problem', ['assault_plan', 'layout', 'dimensions',
+                                 'food', 'seeds', 'max_time', 'max_entries',
+                                 'ant_types'])
+Problem.__new__.__defaults__ = (2, (0, 1, 2), 20, 30, None)
+Problem.__doc__ = """The game that schedules are evolved for.
+
+assault_plan -- a function that returns a new AssaultPlan
+layout -- a layout function such as wet_layout or dry_layout
+dimensions -- a (tunnels, length) pair
+food -- the colony's starting food
+seeds -- the seeds of the games played by every schedule
+max_time -- entries are scheduled before this turn
+max_entries -- the most entries in a schedule
+ant_types -- names of the ant types to deploy (defaults to every type)
+"""
+
+Generation = namedtuple('Generation', ['generation', 'best', 'mean', 'played',
+                                       'cached'])
+Generation.__doc__ = """The fitness of one generation: its best and mean
+fitness, and how many games were played or found in the cache."""
+
+Result = namedtuple('Result', ['schedule', 'fitness', 'win_rate', 'history'])
+
+#############
+# Schedules #
+#############
+
+def canonical(schedule):
+    """Return SCHEDULE as a sorted tuple, which identifies it in the cache."""
+    return tuple(sorted(schedule))
+
+def random_entry(problem, rng):
+    tunnels, length = problem.dimensions
+    names = problem.ant_types or [t.name for t in ant_types()]
+    return (rng.randrange(problem.max_time), rng.randrange(tunnels),
+            rng.randrange(length), rng.choice(names))
+
+def random_schedule(problem, rng):
+    size = rng.randint(1, problem.max_entries)
+    return canonical(random_entry(problem, rng) for _ in range(size))
+
+def mutate(schedule, problem, rng):
+    """Return a copy of SCHEDULE with one entry added, removed or changed."""
+    schedule = list(schedule)
+    choice = rng.random()
+    if (choice < 0.3 or not schedule) and len(schedule) < problem.max_entries:
+        schedule.append(random_entry(problem, rng))
+    elif choice < 0.5 and len(schedule) > 1:
+        del schedule[rng.randrange(len(schedule))]
+    elif schedule:
+        i = rng.randrange(len(schedule))
+        entry, new = list(schedule[i]), random_entry(problem, rng)
+        field = rng.randrange(4)
+        entry[field] = new[field]
+        schedule[i] = tuple(entry)
+    return canonical(schedule)
+
+def crossover(first, second, problem, rng):
+    """Return a schedule made of the entries of FIRST before a random turn and
+    the entries of SECOND from that turn on."""
+    turn = rng.randrange(problem.max_time)
+    child = [e for e in first if e[0] < turn] + [e for e in second if e[0] >= turn]
+    return canonical(child[:problem.max_entries])
+
+###########
+# Fitness #
+###########
+
+def game_fitness(result):
+    """Return the fitness of one GameResult: wins score WIN_FITNESS plus a
+    little for the food left, and losses score the turns survived."""
+    if result.winner == 'ants':
+        return WIN_FITNESS + result.food / 100
+    return result.time
+
+class FitnessCache(object):
+    """Memoizes the fitness and win rate of schedules, and optionally the
+    results of their games in GAMES, an ants_cache.GameCache that persists
+    across runs."""
+
+    def __init__(self, games=None):
+        self.results = {}  # Canonical schedule -> (fitness, win rate)
+        self.played = 0    # Games played, over all evaluations
+        self.games = games
+
+    def evaluate(self, schedules, problem, workers=None):
+        """Return a list of (fitness, win rate) pairs for SCHEDULES, playing
+        the games of those that are not cached across WORKERS processes."""
+        missing = []
+        for schedule in schedules:
+            if schedule not in self.results and schedule not in missing:
+                missing.append(schedule)
+        configs = [GameConfig(problem.assault_plan, problem.layout,
+                              problem.dimensions, problem.food,
+                              ScriptedStrategy(schedule), seed)
+                   for schedule in missing for seed in problem.seeds]
+        fitness = [0] * len(missing)
+        wins = [0] * len(missing)
+        games = self.games
+        hits = games.hits if games is not None else 0
+        for result in simulate_batch(configs, workers, cache=games):
+            i = result.index // len(problem.seeds)
+            fitness[i] += game_fitness(result)
+            wins[i] += result.winner == 'ants'
+        for i, schedule in enumerate(missing):
+            self.results[schedule] = (fitness[i] / len(problem.seeds),
+                                      wins[i] / len(problem.seeds))
+        if games is not None:
+            hits = games.hits - hits  # Games found in the persistent cache
+        self.played += len(configs) - hits
+        return [self.results[schedule] for schedule in schedules]
+
+#############
+# Evolution #
+#############
+
+def evolve(problem, population=40, generations=30, elites=4, tournament=3,
+           crossover_rate=0.5, seed=None, workers=None, cache=None):
+    """Evolve schedules for PROBLEM and return a Result with the best
+    schedule, its fitness and win rate over the problem's seeds, and the
+    history of every Generation."""
+    rng = random.Random(seed)
+    cache = cache or FitnessCache()
+    schedules = [random_schedule(problem, rng) for _ in range(population)]
+    history = []
+    for generation in range(generations):
+        played = cache.played
+        scores = cache.evaluate(schedules, problem, workers)
+        ranked = sorted(zip(schedules, scores), key=lambda pair: -pair[1][0])
+        fitness = [score[0] for score in scores]
+        history.append(Generation(generation, ranked[0][1][0],
+                                  sum(fitness) / len(fitness),
+                                  cache.played - played,
+                                  len(schedules) * len(problem.seeds) -
+                                  (cache.played - played)))
+
+        def select():
+            entrants = rng.sample(ranked, min(tournament, len(ranked)))
+            return max(entrants, key=lambda pair: pair[1][0])[0]
+        children = [schedule for schedule, _ in ranked[:elites]]
+        while len(children) < population:
+            if rng.random() < crossover_rate:
+                child = crossover(select(), select(), problem, rng)
+            else:
+                child = select()
+            children.append(mutate(child, problem, rng))
+        schedules = children
+
+    best, (fitness, win_rate) = max(cache.results.items(),
+                                    key=lambda pair: pair[1][0])
+    return Result(list(best), fitness, win_rate, history)
+
+@main
+def run(*args):
+    import argparse
+    import json
+    from ants_bench import PLANS
+    parser = argparse.ArgumentParser(description="Evolve deployment schedules")
+    parser.add_argument('plan', choices=list(PLANS), help='the assault plan')
+    parser.add_argument('-w', '--water', action='store_true',
+                        help='loads a full layout with water')
+    parser.add_argument('--tunnels', type=int, default=3)
+    parser.add_argument('--length', type=int, default=10)
+    parser.add_argument('--food', type=int, default=2)
+    parser.add_argument('--seeds', type=int, default=3,
+                        help='number of seeds that every schedule plays')
+    parser.add_argument('--population', type=int, default=40)
+    parser.add_argument('--generations', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seeds the evolution itself')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the best schedule to FILE as JSON')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='keep game results in the SQLite database FILE')
+    args = parser.parse_args()
+
+    layout = wet_layout if args.water else dry_layout
+    problem = Problem(PLANS[args.plan], layout, (args.tunnels, args.length),
+                      args.food, tuple(range(args.seeds)))
+    games = None
+    if args.cache:
+        from ants_cache import GameCache
+        games = GameCache(args.cache)
+    try:
+        result = evolve(problem, args.population, args.generations,
+                        seed=args.seed, workers=args.workers,
+                        cache=FitnessCache(games))
+    finally:
+        if games is not None:
+            games.close()
+    for g in result.history:
+        print('generation {0:3}: best {1:8.2f} mean {2:8.2f} '
+              '({3} games played, {4} cached)'.format(*g))
+    print('best fitness {0:.2f}, win rate {1:.0%}'.format(result.fitness,
+                                                         result.win_rate))
+    for entry in result.schedule:
+        print('  turn {0:2}: tunnel {1} step {2} {3}'.format(*entry))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result.schedule, f)
@@ -19,6 +19,7 @@ how many bees remain in the beehive.
 """
 
 import ants
+import ants_loop
 import ants_plans
 
 import graphics
@@ -79,29 +80,61 @@ LEAF_COLORS = {'Thrower': 'ForestGreen',
 
 
 class AntsGUI:
-    """GUI-based interactive strategy that logs all colony updates."""
-
-    def __init__(self):
+    """GUI-based interactive strategy that logs all colony updates.
+
+    turn_seconds -- the length of each turn, during which clicks are taken
+    fast_forward -- whether to play each turn as soon as it is drawn
+    headless -- whether to play without a window, taking only scripted clicks
+    script -- a list of (time, place name, ant type name) clicks, played as if
+              the ant type and then the place were clicked at that time
+    atlas -- a sprite atlas file from which to load images, made on first use
+    """
+
+    def __init__(self, turn_seconds=STRATEGY_SECONDS, fast_forward=False,
+                 headless=False, script=(), atlas=None):
         self.initialized = False
+        self.atlas = atlas
+        if fast_forward:
+            turn_seconds = 0
+        self.turn_seconds = max(turn_seconds, graphics.FRAME_TIME)  # At least one frame
+        self.fast_forward = fast_forward
+        self.headless = headless
+        self.script = {}
+        for time, place_name, ant_type_name in script:
+            self.script.setdefault(time, []).append((place_name, ant_type_name))
+        self.ant_type_selected = None
 
     def initialize_colony_graphics(self, colony):
         """Create canvas, control panel, places, and labels."""
         self.initialized = True
         self.canvas = graphics.Canvas()
+        self._load_images()
         self.food_text = self.canvas.draw_text('Food: 1  Time: 0', (20, 20))
         self.ant_text = self.canvas.draw_text('Ant selected: None', (20, 140))
         self._click_rectangles = list()
         self._init_control_panel(colony)
         self._init_places(colony)
-
-        start_text = self.canvas.draw_text('CLICK TO START', MESSAGE_POS)
-        self.canvas.wait_for_click()
-        self.canvas.clear(start_text)
+        self.dirty = set(self.place_order)  # Places to redraw
+        self.colony = colony  # The colony whose events mark places dirty
+        ants.event_bus.subscribe(self._mark_dirty, ['move', 'deploy', 'remove',
+                                                    'death', 'end'])
+
+    def _load_images(self):
+        """Load every image before the game starts, so that no turn waits on
+        an image file, and report how long it took."""
+        image_files = list(INSECT_FILES.values()) + [TUNNEL_FILE]
+        if self.atlas is not None and not os.path.exists(self.atlas):
+            self.canvas.save_atlas(image_files, self.atlas)
+        seconds = self.canvas.preload_images(image_files, atlas=self.atlas)
+        print('Loaded {0} images in {1:.0f} ms'.format(len(set(image_files)),
+                                                       seconds * 1000))
 
     def _init_control_panel(self, colony):
         """Construct the control panel of available ant types."""
         self.ant_type_selected = None
         self.ant_type_frames = []  # rectangle ids of frames.
+        self.frame_colors = {}  # rectangle id -> fill color
+        self.texts = {}  # text id -> text
         panel_pos = PANEL_POS
         for name, ant_type in colony.ant_types.items():
             width = ANT_IMAGE_WIDTH + 2 * PANEL_PADDING[0]
@@ -125,6 +158,10 @@ class AntsGUI:
         self.place_points = dict()
         # self.images: place_name -> insect instance -> image id
         self.images = {'AntQueen': dict()}
+        # self.image_places: insect instance -> place_name in self.images
+        self.image_places = dict()
+        # self.place_order: place_name -> position, for the places redrawn
+        self.place_order = dict()
         place_pos = PLACE_POS
         width = BEE_IMAGE_WIDTH + 2 * PLACE_PADDING[0]
         height = ANT_IMAGE_HEIGHT + 2 * PLACE_PADDING[1]
@@ -137,27 +174,15 @@ class AntsGUI:
                 place_pos = shift_point(PLACE_POS, row_offset)
                 rows += 1
             def on_click(colony, frame, name=name):
-                ant_type = self.ant_type_selected
-                existing_ant = colony.places[name].ant
-                if ant_type == 'Remover':
-                    if existing_ant is not None:
-                        print("colony.remove_ant('{0}')".format(name))
-                        colony.remove_ant(name)
-                        self._update_places(colony)
-                elif ant_type is not None:
-                    try:
-                        print("colony.deploy_ant('{0}', '{1}')".format(name,
-                                                                       ant_type))
-                        colony.deploy_ant(name, ant_type)
-                        self._update_places(colony)
-                    except Exception as e:
-                        print(e)
+                self._click_place(colony, name)
+                self._update_places(colony)
             color = 'Blue' if place.name.startswith('water') else 'White'
             frame = self.add_click_rect(place_pos, width, height, on_click,
                                              color=color)
             self.canvas.draw_image(place_pos, TUNNEL_FILE)
             self.place_points[name] = place_pos
             self.images[name] = dict()
+            self.place_order[name] = len(self.place_order)
             place_pos = shift_point(place_pos, (width + PLACE_MARGIN, 0))
 
         # Hive
@@ -175,27 +200,127 @@ class AntsGUI:
         self._click_rectangles.append((pos, width, height, frame, on_click))
         return frame
 
+    def _click_place(self, colony, name):
+        """Deploy the selected ant type to the place NAME, or remove its ant
+        if the Remover is selected."""
+        ant_type = self.ant_type_selected
+        existing_ant = colony.places[name].ant
+        if ant_type == 'Remover':
+            if existing_ant is not None:
+                print("colony.remove_ant('{0}')".format(name))
+                colony.remove_ant(name)
+        elif ant_type is not None:
+            try:
+                print("colony.deploy_ant('{0}', '{1}')".format(name,
+                                                               ant_type))
+                colony.deploy_ant(name, ant_type)
+            except Exception as e:
+                print(e)
+
+    def _play_script(self, colony):
+        """Make the scripted clicks of this turn."""
+        for place_name, ant_type_name in self.script.get(colony.time, []):
+            self.ant_type_selected = ant_type_name
+            self._click_place(colony, place_name)
+
     def strategy(self, colony):
-        """The strategy function is called by the ants.AntColony each turn."""
+        """The strategy function is called by the ants.AntColony each turn.
+
+        It draws the game and takes clicks until the turn is over, so the
+        game only advances while it waits. See play for a GUI whose game
+        runs on a clock of its own."""
+        if self.headless:
+            self._play_script(colony)
+            return
         if not self.initialized:
             self.initialize_colony_graphics(colony)
+            if not self.fast_forward:
+                start_text = self.canvas.draw_text('CLICK TO START', MESSAGE_POS)
+                self.canvas.wait_for_click()
+                self.canvas.clear(start_text)
+        self._play_script(colony)
         elapsed = 0  # Physical time elapsed this turn
-        while elapsed < STRATEGY_SECONDS:
-            self._update_control_panel(colony)
-            self._update_places(colony)
-            msg = 'Food: {0}  Time: {1}'.format(colony.food, colony.time)
-            self.canvas.edit_text(self.food_text, text=msg)
-            pos, el = self.canvas.wait_for_click(STRATEGY_SECONDS - elapsed)
+        while elapsed < self.turn_seconds:
+            self._draw(colony)
+            pos, el = self.canvas.wait_for_click(self.turn_seconds - elapsed)
             elapsed += el
             if pos is not None:
                 self._interpret_click(pos, colony)
-
-        # Throw leaves at the end of the turn
+        self._throw_leaves(colony)
+
+    def play(self, colony):
+        """Play COLONY on an ants_loop.GameLoop, one turn every turn_seconds,
+        while this thread runs a single Tk event loop that draws the game
+        every frame and takes clicks. Return True if the ants win."""
+        self.initialize_colony_graphics(colony)
+        colony.strategy = self._play_script
+        self.loop = ants_loop.GameLoop()
+        self.game = None
+        self.drawn_time = colony.time
+        if self.fast_forward:
+            self.game = self.loop.play(colony, self.turn_seconds)
+        else:
+            self.start_text = self.canvas.draw_text('CLICK TO START', MESSAGE_POS)
+        self._frame(colony)
+        self.canvas._tk.mainloop()
+        self.loop.stop()
+        return self.game.result()
+
+    def _frame(self, colony):
+        """Draw one frame of the game played by play, and schedule the next
+        until the game is over."""
+        pos = self.canvas.take_click()
+        if self.game is None:
+            if pos is not None:
+                self.canvas.clear(self.start_text)
+                self.game = self.loop.play(colony, self.turn_seconds)
+        else:
+            over = self.game.done()
+            with self.loop.locked(colony):
+                if pos is not None and not over:
+                    self._interpret_click(pos, colony)
+                self._draw(colony)
+                if colony.time != self.drawn_time:
+                    self.drawn_time = colony.time
+                    self._throw_leaves(colony)
+            if over:
+                self.canvas._tk.quit()
+                return
+        self.canvas._tk.after(int(graphics.FRAME_TIME * 1000),
+                              lambda: self._frame(colony))
+
+    def _draw(self, colony):
+        """Reflect the game state in the control panel, places and labels."""
+        self._update_control_panel(colony)
+        self._update_places(colony)
+        msg = 'Food: {0}  Time: {1}'.format(colony.food, colony.time)
+        self._edit_text(self.food_text, msg)
+
+    def _throw_leaves(self, colony):
+        """Throw leaves at the end of the turn."""
         has_ant = lambda a: hasattr(a, 'ant') and a.ant
         for ant in colony.ants + [a.ant for a in colony.ants if has_ant(a)]:
             if ant.name in LEAF_COLORS:
                 self._throw(ant, colony)
 
+    def _mark_dirty(self, kind, insect_or_colony, *places):
+        """An event sink that marks the places of an event for redrawing. The
+        events of other colonies in this process are ignored."""
+        colony = ants.event_colony(kind, (insect_or_colony,) + places)
+        if colony is not self.colony:
+            return
+        if kind == 'end':
+            ants.event_bus.unsubscribe(self._mark_dirty)
+        for place in places:
+            if place is not None:
+                self.dirty.add(place.name)
+
+    def _edit_text(self, id, text):
+        """Set the text of ID, if it has changed."""
+        if self.texts.get(id) != text:
+            self.texts[id] = text
+            self.canvas.edit_text(id, text=text)
+
     def _interpret_click(self, pos, colony):
         """Interpret a click position by finding its click rectangle."""
         x, y = pos
@@ -213,9 +338,10 @@ class AntsGUI:
                 color = 'Gray'
             elif name == self.ant_type_selected:
                 color = 'Blue'
-                msg = 'Ant selected: {0}'.format(name)
-                self.canvas.edit_text(self.ant_text, text=msg)
-            self.canvas._canvas.itemconfigure(frame, fill=color)
+                self._edit_text(self.ant_text, 'Ant selected: {0}'.format(name))
+            if self.frame_colors.get(frame) != color:
+                self.frame_colors[frame] = color
+                self.canvas._canvas.itemconfigure(frame, fill=color)
 
     def _update_places(self, colony):
         """Reflect the game state in the play area.
@@ -224,10 +350,15 @@ class AntsGUI:
           - Adding Ant images for newly placed ants
           - Moving Bee images for bees that have advanced
           - Moving insects out of play when they have expired
+
+        Only the places marked dirty by game events are redrawn, in the order
+        in which they were laid out.
         """
-        for name, place in colony.places.items():
-            if place.name == 'Hive':
-                continue
+        dirty = sorted((n for n in self.dirty if n in self.place_order),
+                       key=self.place_order.get)
+        self.dirty = set()
+        for name in dirty:
+            place = colony.places[name]
             current = self.images[name].keys()
 
             # Add/move missing insects
@@ -240,24 +371,26 @@ class AntsGUI:
                     self._draw_insect(place.ant, name)
             for bee in place.bees:
                 if bee not in current:
-                    for other_place, images in self.images.items():
-                        if bee in images:
-                            break
-                    image = self.images[other_place].pop(bee)
+                    if bee not in self.image_places:
+                        # A bee of a LazyAssaultPlan, drawn in the hive
+                        self._draw_insect(bee, colony.beehive.name, True)
+                    image = self.images[self.image_places[bee]].pop(bee)
                     pos = shift_point(self.place_points[name], PLACE_PADDING)
-                    self.canvas.slide_shape(image, pos, STRATEGY_SECONDS)
+                    self.canvas.slide_shape(image, pos, self.turn_seconds)
                     self.images[name][bee] = image
+                    self.image_places[bee] = name
 
             # Remove expired insects
-            valid_insects = set(place.bees + [place.ant])
+            valid_insects = set(place.bees) | {place.ant}
             if place.ant is not None and hasattr(place.ant, 'is_container') and \
                 place.ant.is_container:
                 valid_insects.add(place.ant.contained_ant)
             for insect in current - valid_insects:
                 if not place.exit or insect not in self.images[place.exit.name]:
                     image = self.images[name].pop(insect)
+                    del self.image_places[insect]
                     pos = (self.place_points[name][0], CRYPT)
-                    self.canvas.slide_shape(image, pos, STRATEGY_SECONDS)
+                    self.canvas.slide_shape(image, pos, self.turn_seconds)
 
     def _draw_insect(self, insect, place_name, random_offset=False, behind=0):
         """Draw an insect and store the ID of its image."""
@@ -267,6 +400,7 @@ class AntsGUI:
             pos = shift_point(pos, (random.randint(-10, 10), random.randint(-50, 50)))
         image = self.canvas.draw_image(pos, image_file, behind=behind)
         self.images[place_name][insect] = image
+        self.image_places[insect] = place_name
 
     def _throw(self, ant, colony):
         """Animate a leaf thrown at a Bee."""
@@ -274,7 +408,8 @@ class AntsGUI:
         if bee:
             start = shift_point(self.place_points[ant.place.name], LEAF_START_OFFSET)
             end = shift_point(self.place_points[bee.place.name], LEAF_END_OFFSET)
-            animate_leaf(self.canvas, start, end, color=LEAF_COLORS[ant.name])
+            duration = min(0.3, self.turn_seconds)
+            animate_leaf(self.canvas, start, end, duration, LEAF_COLORS[ant.name])
 
 def leaf_coords(pos, angle, length):
     """Return the coordinates of a leaf polygon."""
@@ -294,17 +429,35 @@ def animate_leaf(canvas, start, end, duration=0.3, color='ForestGreen'):
     num_frames = duration / graphics.FRAME_TIME
     increment = tuple([(e-s) / num_frames for s, e in zip(start, end)])
     def points_fn(frame_count):
-        nonlocal start
         angle = pi / 8 * frame_count
-        cs = leaf_coords(start, angle, length)
-        start = shift_point(start, increment)
-        return cs
+        pos = shift_point(start, [i * frame_count for i in increment])
+        return leaf_coords(pos, angle, length)
     canvas.animate_shape(leaf, duration, points_fn)
     canvas._canvas.after(int(1000*duration) + 1, lambda: canvas.clear(leaf))
 
 from utils import *
 @main
 def run(*args):
-    ants.Insect.reduce_armor = class_method_wrapper(ants.Insect.reduce_armor,
-            pre=print_expired_insects)
-    ants_plans.start_with_strategy(args, AntsGUI().strategy)
+    if '--sweep' in args:
+        ants_plans.start_with_strategy(args, None)  # Sweeps have no window
+        return
+    ants.event_bus.subscribe(print_expired, ['death'])
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--turn-seconds', type=float, default=STRATEGY_SECONDS)
+    parser.add_argument('--fast', action='store_true')
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--script')
+    parser.add_argument('--atlas')
+    gui_args, args = parser.parse_known_args(args)
+    script = ()
+    if gui_args.script:
+        with open(gui_args.script) as f:
+            script = json.load(f)
+    gui = AntsGUI(gui_args.turn_seconds, gui_args.fast, gui_args.headless, script,
+                  gui_args.atlas)
+    if gui_args.headless:
+        ants_plans.start_with_strategy(args, gui.strategy)
+    else:
+        ants_plans.start_with_strategy(args, gui.strategy, gui.play)
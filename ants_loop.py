@@ -0,0 +1,82 @@
+"""An event-driven game loop for Ants Vs. SomeBees.
+
+GameLoop plays games on an asyncio event loop that runs in a worker thread of
+its own. Each game advances one turn every turn_seconds of wall-clock time,
+so a slow renderer never holds back the game clock, and one GameLoop can play
+any number of boards at once:
+
+>>> from ants_batch import GameConfig, make_colony
+>>> from ants_plans import make_test_assault_plan
+>>> loop = GameLoop()
+>>> colonies = [make_colony(GameConfig(make_test_assault_plan, dry_layout,
+...                                    (1, 9), seed=s)) for s in range(2)]
+>>> games = [loop.play(colony, turn_seconds=0.01) for colony in colonies]
+>>> [game.result() for game in games]
+The ant queen has perished. Please try again.
+The ant queen has perished. Please try again.
+[False, False]
+>>> loop.stop()
+
+Renderers and input handlers in other threads, such as the Tk thread of
+ants_gui, read or change a colony only within loop.locked(colony).
+"""
+
+import asyncio
+import contextlib
+import threading
+
+from ants import *
+
+class GameLoop(object):
+    """Plays colonies on an asyncio event loop in a worker thread."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.lock = threading.RLock()
+        self.queen_status = {}  # Colony -> its QueenAnt.queen_status
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name='GameLoop', daemon=True)
+        self.thread.start()
+
+    def play(self, colony, turn_seconds=0, profiler=None):
+        """Start playing COLONY, one turn every TURN_SECONDS, and return a
+        concurrent.futures.Future of its result (True if the ants win)."""
+        self.queen_status[colony] = QueenAnt.queen_status
+        game = self._play(colony, turn_seconds, profiler)
+        return asyncio.run_coroutine_threadsafe(game, self.loop)
+
+    async def _play(self, colony, turn_seconds, profiler):
+        turns = colony.turns(profiler)
+        next_turn = self.loop.time()
+        try:
+            while True:
+                with self.locked(colony):
+                    try:
+                        next(turns)
+                    except StopIteration as end:
+                        return end.value
+                # Turns are timed from the start of the game, so a late turn
+                # is followed at once by the next
+                next_turn += turn_seconds
+                await asyncio.sleep(max(0, next_turn - self.loop.time()))
+        finally:
+            self.queen_status.pop(colony, None)
+
+    @contextlib.contextmanager
+    def locked(self, colony):
+        """Hold the lock of the game loop, with the QueenAnt flag of COLONY
+        in place, since every game has a true queen of its own."""
+        with self.lock:
+            saved = QueenAnt.queen_status
+            QueenAnt.queen_status = self.queen_status.get(colony, saved)
+            try:
+                yield colony
+            finally:
+                if colony in self.queen_status:
+                    self.queen_status[colony] = QueenAnt.queen_status
+                QueenAnt.queen_status = saved
+
+    def stop(self):
+        """Stop the event loop and its thread, abandoning unfinished games."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,544 @@
+"""A NumPy structure-of-arrays engine for Ants Vs. SomeBees.
+
+ArrayColony plays the same game as ants.AntColony and takes the same arguments,
+but it does not keep an object per insect. Armor, damage, place index, type
+code and flags of every ant and bee live in NumPy arrays, and the Topology of
+the places is compiled into a grid of tunnels. Under a fixed seed, an
+ArrayColony makes the same random draws in the same order as an AntColony, so
+both engines play identical games:
+
+>>> from ants_plans import make_test_assault_plan
+>>> def strategy(colony):
+...     if colony.time == 0:
+...         colony.deploy_ant('tunnel_0_0', 'Thrower')
+>>> colony = ArrayColony(strategy, Hive(make_test_assault_plan()), ant_types(),
+...                      dry_layout, (1, 9), food=3, seed=1)
+>>> colony.simulate()
+All bees are vanquished. You win!
+True
+>>> colony.time
+7
+
+Only the ant and bee classes defined in ants.py are supported, along with
+layouts made of straight tunnels such as wet_layout and dry_layout.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import ants
+from ants import *
+
+# Ant behaviors
+HARVESTER, THROWER, FIRE, HUNGRY, NINJA, WALL, BODYGUARD, TANK, QUEEN = range(9)
+
+ANT_BEHAVIORS = {
+    ants.HarvesterAnt: HARVESTER,
+    ants.ThrowerAnt: THROWER,
+    ants.ShortThrower: THROWER,
+    ants.LongThrower: THROWER,
+    ants.ScubaThrower: THROWER,
+    ants.FireAnt: FIRE,
+    ants.HungryAnt: HUNGRY,
+    ants.NinjaAnt: NINJA,
+    ants.WallAnt: WALL,
+    ants.BodyguardAnt: BODYGUARD,
+    ants.TankAnt: TANK,
+    ants.QueenAnt: QUEEN,
+}
+
+BEE_TYPES = [ants.Bee, ants.Wasp, ants.Hornet, ants.NinjaBee, ants.Boss]
+
+
+class ArrayColony(object):
+    """An ant colony whose insects are stored as NumPy arrays.
+
+    Attributes:
+    time -- elapsed time
+    food -- the colony's available food total
+    places -- an OrderedDict from place names to place indices
+    """
+
+    def __init__(self, strategy, beehive, ant_types, create_places, dimensions,
+                 food=2, seed=None):
+        """Create an ArrayColony for simulating a game.
+
+        Arguments:
+        strategy -- a function to deploy ants to places
+        beehive -- a Hive full of bees
+        ant_types -- a list of ant constructors
+        create_places -- a function that creates the set of places
+        dimensions -- a pair containing the dimensions of the game layout
+        seed -- seeds a random stream of the colony's own, or None to share
+                the global random module
+        """
+        self.time = 0
+        self.food = food
+        self.rng = random_stream(seed)
+        self.strategy = strategy
+        self.ant_types = OrderedDict((a.name, a) for a in ant_types)
+        self.dimensions = dimensions
+        self._compile_places(beehive, create_places)
+        self._compile_ant_types()
+        self._compile_bees(beehive.assault_plan)
+        self._nearest = None
+
+    ###############
+    # Compilation #
+    ###############
+
+    def _compile_places(self, beehive, create_places):
+        """Lay out the places with AntColony's own layout functions and
+        compile them into a Topology, whose ids index the place arrays. Id 0
+        is the Hive and the last id is the base where the queen resides."""
+        base = QueenPlace('AntQueen')
+        places = [beehive]
+        def register_place(place, is_bee_entrance):
+            places.append(place)
+            if is_bee_entrance:
+                place.entrance = beehive
+        create_places(base, register_place, self.dimensions[0], self.dimensions[1])
+        topology = Topology(places, base)
+
+        self._base = base.id
+        self.places = OrderedDict((p.name, p.id) for p in places)
+        self._names = [p.name for p in topology.places]
+        self._exit = np.array(topology.exits)
+        self._water = np.array(topology.water)
+        self._bee_entrances = topology.bee_entrances
+        rows = topology.tunnels
+        if sorted(i for row in rows for i in row) != list(range(1, self._base)):
+            raise ValueError('ArrayColony only supports straight tunnels')
+        width = max(len(row) for row in rows) + 1
+        self._grid = np.full((len(rows), width), self._base)
+        for t, row in enumerate(rows):
+            self._grid[t, :len(row)] = row
+        self._tunnel = np.array(topology.tunnel)
+        self._depth = np.array(topology.depth)
+        self._columns = np.arange(width)
+        self._top = np.full(len(topology.places), -1)     # The outermost ant per place
+        self._counts = np.zeros(len(topology.places), dtype=int)  # Bees per place
+
+    def _compile_ant_types(self):
+        """Tabulate the class attributes of every ant type, indexed by type code."""
+        types = list(self.ant_types.values())
+        for ant_type in types:
+            if ant_type not in ANT_BEHAVIORS:
+                raise ValueError('ArrayColony does not support ' + ant_type.__name__)
+        self._type_codes = {t: code for code, t in enumerate(types)}
+        self._type_names = [t.name for t in types]
+        self._type_kind = np.array([ANT_BEHAVIORS[t] for t in types])
+        self._type_armor = np.array([t.__init__.__defaults__[0] for t in types], dtype=float)
+        self._type_damage = np.array([t.damage for t in types], dtype=float)
+        self._type_min_range = np.array([getattr(t, 'min_range', 0) for t in types])
+        self._type_max_range = np.array([getattr(t, 'max_range', 0) for t in types], dtype=float)
+        self._type_digest = np.array([getattr(t, 'time_to_digest', 0) for t in types])
+        self._type_blocks = np.array([t.blocks_path for t in types])
+        self._type_watersafe = np.array([t.is_watersafe for t in types])
+        self._type_container = np.array([t.is_container for t in types])
+
+        self._num_ants = 0
+        self._ant_armor = np.zeros(0)
+        self._ant_damage = np.zeros(0)
+        self._ant_place = np.zeros(0, dtype=int)
+        self._ant_type = np.zeros(0, dtype=int)
+        self._ant_kind = np.zeros(0, dtype=int)
+        self._ant_blocks = np.zeros(0, dtype=bool)
+        self._ant_watersafe = np.zeros(0, dtype=bool)
+        self._ant_container = np.zeros(0, dtype=bool)
+        self._ant_contained = np.zeros(0, dtype=int)
+        self._ant_digesting = np.zeros(0, dtype=int)
+        self._ant_boosted = np.zeros(0, dtype=bool)
+        self._ant_imposter = np.zeros(0, dtype=bool)
+        self._grow_ants(16)
+
+    def _compile_bees(self, assault_plan):
+        """Tabulate every bee of ASSAULT_PLAN; all of them start in the Hive."""
+        for bee_type in BEE_TYPES:
+            assert bee_type.action in (ants.Bee.action, ants.Hornet.action)
+        self._bee_type_names = [t.name for t in BEE_TYPES]
+        self._bee_type_damage = np.array([t.damage for t in BEE_TYPES], dtype=float)
+        self._bee_type_twice = np.array([t.action is ants.Hornet.action for t in BEE_TYPES])
+        self._bee_type_unblocked = np.array([t.blocked is ants.NinjaBee.blocked for t in BEE_TYPES])
+        self._bee_type_cap = np.array([getattr(t, 'damage_cap', 0) for t in BEE_TYPES], dtype=float)
+
+        codes = {t: code for code, t in enumerate(BEE_TYPES)}
+        types, armor, waves = [], [], {}
+        for time, bee_type, bee_armor in assault_plan.descriptors():
+            if bee_type not in codes:
+                raise ValueError('ArrayColony does not support ' + bee_type.__name__)
+            waves.setdefault(time, []).append(len(types))
+            types.append(codes[bee_type])
+            armor.append(bee_armor)
+        self._waves = {time: np.array(wave) for time, wave in waves.items()}
+        self._bee_type = np.array(types, dtype=int)
+        self._bee_armor = np.array(armor, dtype=float)
+        self._bee_place = np.zeros(len(types), dtype=int)   # Everyone is in the Hive
+        self._bee_stamp = np.arange(len(types))             # Arrival order in a place
+        self._bee_damage = self._bee_type_damage[self._bee_type]
+        self._bee_twice = self._bee_type_twice[self._bee_type]
+        self._bee_unblocked = self._bee_type_unblocked[self._bee_type]
+        self._bee_cap = self._bee_type_cap[self._bee_type]
+        self._stamp = len(types)
+        self._counts[0] = len(types)
+        self._active = np.zeros(0, dtype=int)
+
+    ##############
+    # Simulation #
+    ##############
+
+    def simulate(self):
+        """Simulate an attack on the ant colony (i.e., play the game)."""
+        num_bees = int(np.count_nonzero(self._bee_place >= 0))
+        try:
+            while True:
+                self.strategy(self)                 # Ants deploy
+                self._release_bees()                # Bees invade
+                self._ants_act()                    # Ants take actions
+                num_bees -= self._bees_act()        # Bees take actions
+                if num_bees == 0:
+                    raise AntsWinException()
+                self.time += 1
+        except AntsWinException:
+            print('All bees are vanquished. You win!')
+            return True
+        except BeesWinException:
+            print('The ant queen has perished. Please try again.')
+            return False
+
+    def _release_bees(self):
+        """Move this turn's wave from the Hive into random bee entrances."""
+        wave = self._waves.get(self.time)
+        if wave is None:
+            return
+        entrances = [self.rng.choice(self._bee_entrances) for _ in range(len(wave))]
+        self._move_bees(wave, np.array(entrances, dtype=int))
+        self._active = np.concatenate([self._active, wave])
+
+    def _ants_act(self):
+        """Let every ant act, in the order of places."""
+        tops = self._top[:self._base]
+        tops = tops[tops >= 0]
+        self._refresh_nearest()
+        for ant in tops.tolist():
+            if self._ant_armor[ant] > 0:
+                self._ant_action(ant)
+        self._nearest = None
+
+    def _bees_act(self):
+        """Let every active bee act and return the number of bees that expired.
+
+        Bees that are not blocked move together. Bees that may interact with an
+        ant (those in a place with a blocking ant) and Hornets act one at a
+        time. Before each of them acts, every bee ahead of it in line moves, so
+        that the order of events matches AntColony.simulate.
+        """
+        active = self._active
+        if len(active) == 0:
+            return 0
+        alive = self._bee_armor[active] > 0
+        tops = self._top[self._bee_place[active]]
+        blocked = (tops >= 0) & self._ant_blocks[np.maximum(tops, 0)]
+        one_at_a_time = alive & (blocked | self._bee_twice[active])
+        movers = alive & ~one_at_a_time
+        expired = ~alive
+        start = 0
+        for position in np.flatnonzero(one_at_a_time).tolist():
+            self._flush_movers(active[start:position][movers[start:position]])
+            bee = active[position]
+            self._bee_action(bee)
+            expired[position] = self._bee_armor[bee] <= 0
+            start = position + 1
+        self._flush_movers(active[start:][movers[start:]])
+        self._active = active[~expired]
+        return int(np.count_nonzero(expired))
+
+    def _flush_movers(self, bees):
+        """Move unblocked BEES to the exits of their places, in order."""
+        if len(bees) == 0:
+            return
+        exits = self._exit[self._bee_place[bees]]
+        escaped = np.flatnonzero(exits == self._base)
+        if len(escaped):
+            first = escaped[0]
+            self._move_bees(bees[:first], exits[:first])
+            self._move_bee(bees[first], self._base)  # Raises BeesWinException
+        self._move_bees(bees, exits)
+
+    ########
+    # Ants #
+    ########
+
+    def _ant_action(self, ant):
+        """The action performed by ANT each turn."""
+        kind = self._ant_kind[ant]
+        place = self._ant_place[ant]
+        if kind == HARVESTER:
+            self.food += 1
+        elif kind == THROWER:
+            self._throw(ant)
+        elif kind == HUNGRY:
+            if self._ant_digesting[ant] > 0:
+                self._ant_digesting[ant] -= 1
+            else:
+                bee = self._random_bee(place)
+                if bee >= 0:
+                    self._damage_bees(np.array([bee]), self._bee_armor[bee])
+                    self._ant_digesting[ant] = self._type_digest[self._ant_type[ant]]
+        elif kind == NINJA:
+            self._damage_bees(self._bees_at(place), self._ant_damage[ant])
+        elif kind == BODYGUARD or kind == TANK:
+            contained = self._ant_contained[ant]
+            if contained >= 0:
+                self._ant_action(contained)
+            if kind == TANK:
+                self._damage_bees(self._bees_at(place), self._ant_damage[ant])
+        elif kind == QUEEN:
+            if self._ant_imposter[ant]:
+                self._damage_ant(ant, self._ant_armor[ant])
+            else:
+                self._throw(ant)
+                self._boost_behind(place)
+
+    def _throw(self, ant):
+        """Throw a leaf at the nearest bee in range of the thrower ANT."""
+        bee = self._nearest_bee(ant)
+        if bee >= 0:
+            self._damage_bees(np.array([bee]), self._ant_damage[ant])
+
+    def _nearest_bee(self, ant):
+        """Return the bee index targeted by the thrower ANT, or -1.
+
+        Mirrors ThrowerAnt.nearest_bee: the first occupied place in range
+        towards the Hive, falling back on the thrower's own place.
+        """
+        place = self._ant_place[ant]
+        tunnel, depth = self._tunnel[place], self._depth[place]
+        code = self._ant_type[ant]
+        start = min(depth + self._type_min_range[code], self._grid.shape[1] - 1)
+        found = self._nearest[tunnel, start]
+        if found < self._grid.shape[1] - 1 and found - depth < self._type_max_range[code]:
+            return self._random_bee(self._grid[tunnel, found])
+        return self._random_bee(place)
+
+    def _refresh_nearest(self, tunnels=slice(None)):
+        """Recompute, for every tunnel depth, the nearest occupied depth at or
+        beyond it (the grid width when there is none)."""
+        if self._nearest is None:
+            self._nearest = np.empty(self._grid.shape, dtype=int)
+        occupied = self._counts[self._grid[tunnels]] > 0
+        depths = np.where(occupied, self._columns, self._grid.shape[1] - 1)
+        self._nearest[tunnels] = np.minimum.accumulate(depths[..., ::-1], axis=-1)[..., ::-1]
+
+    def _boost_behind(self, place):
+        """Double the damage of every ant behind the queen at PLACE, once."""
+        behind = self._grid[self._tunnel[place], :self._depth[place]]
+        tops = self._top[behind]
+        tops = tops[tops >= 0]
+        contained = self._ant_contained[tops[self._ant_container[tops]]]
+        for group in (tops, contained[contained >= 0]):
+            fresh = group[~self._ant_boosted[group]]
+            self._ant_damage[fresh] *= 2
+            self._ant_boosted[fresh] = True
+
+    def _new_ant(self, ant_type):
+        """Allocate an ant of ANT_TYPE and return its index."""
+        if self._num_ants == len(self._ant_armor):
+            self._grow_ants(2 * self._num_ants)
+        ant = self._num_ants
+        self._num_ants += 1
+        code = self._type_codes[ant_type]
+        self._ant_type[ant] = code
+        self._ant_kind[ant] = self._type_kind[code]
+        self._ant_armor[ant] = self._type_armor[code]
+        self._ant_damage[ant] = self._type_damage[code]
+        self._ant_blocks[ant] = self._type_blocks[code]
+        self._ant_watersafe[ant] = self._type_watersafe[code]
+        self._ant_container[ant] = self._type_container[code]
+        self._ant_place[ant] = -1
+        self._ant_contained[ant] = -1
+        self._ant_digesting[ant] = 0
+        self._ant_boosted[ant] = False
+        if self._ant_kind[ant] == QUEEN:
+            # Only the first queen ever made is the true queen, as in QueenAnt
+            self._ant_imposter[ant] = ants.QueenAnt.queen_status
+            ants.QueenAnt.queen_status = True
+        return ant
+
+    def _grow_ants(self, size):
+        for name in ('_ant_armor', '_ant_damage', '_ant_place', '_ant_type',
+                     '_ant_kind', '_ant_blocks', '_ant_watersafe', '_ant_container',
+                     '_ant_contained', '_ant_digesting', '_ant_boosted', '_ant_imposter'):
+            array = getattr(self, name)
+            grown = np.zeros(size, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _add_ant(self, place, ant):
+        """Add ANT to PLACE, following Place.add_insect and Water.add_insect."""
+        top = self._top[place]
+        if top < 0:
+            self._top[place] = ant
+        elif self._can_contain(top, ant):
+            self._ant_contained[top] = ant
+        elif self._can_contain(ant, top):
+            self._ant_contained[ant] = top
+            self._top[place] = ant
+        else:
+            assert False, 'Two ants in {0}'.format(self._names[place])
+        self._ant_place[ant] = place
+        if self._water[place] and not self._ant_watersafe[ant]:
+            self._damage_ant(ant, self._ant_armor[ant])
+
+    def _can_contain(self, container, other):
+        return (self._ant_container[container] and not self._ant_container[other]
+                and self._ant_contained[container] < 0)
+
+    def _remove_ant(self, ant):
+        """Remove ANT from its place, following Place.remove_insect."""
+        if self._ant_kind[ant] == QUEEN and not self._ant_imposter[ant]:
+            return
+        place = self._ant_place[ant]
+        top = self._top[place]
+        if top == ant:
+            self._top[place] = self._ant_contained[ant] if self._ant_container[ant] else -1
+        elif top >= 0 and self._ant_container[top] and self._ant_contained[top] == ant:
+            self._ant_contained[top] = -1
+        else:
+            assert False, '{0} is not in {1}'.format(ant, self._names[place])
+        self._ant_place[ant] = -1
+
+    def _damage_ant(self, ant, amount):
+        """Reduce the armor of ANT by AMOUNT, following its reduce_armor."""
+        kind = self._ant_kind[ant]
+        place = self._ant_place[ant]
+        self._ant_armor[ant] -= amount
+        expired = self._ant_armor[ant] <= 0
+        if kind == FIRE:
+            bonus = self._ant_damage[ant] if expired else 0
+            self._damage_bees(self._bees_at(place), amount + bonus)
+        if expired:
+            self._remove_ant(ant)
+            if kind == QUEEN and not self._ant_imposter[ant]:
+                bees_win()
+
+    ########
+    # Bees #
+    ########
+
+    def _bee_action(self, bee):
+        """A bee stings the ant that blocks it, or moves to the exit of its
+        place. Hornets do this twice."""
+        for _ in range(2 if self._bee_twice[bee] else 1):
+            if self._bee_armor[bee] <= 0:
+                return
+            place = self._bee_place[bee]
+            ant = self._top[place]
+            if ant >= 0 and self._ant_blocks[ant] and not self._bee_unblocked[bee]:
+                self._damage_ant(ant, self._bee_damage[bee])
+            elif self._exit[place] >= 0:
+                self._move_bee(bee, self._exit[place])
+
+    def _move_bee(self, bee, place):
+        """Move BEE to PLACE. Reaching the base ends the game."""
+        self._counts[self._bee_place[bee]] -= 1
+        if place == self._base:
+            self._bee_place[bee] = -1
+            bees_win()
+        self._counts[place] += 1
+        self._bee_place[bee] = place
+        self._bee_stamp[bee] = self._stamp
+        self._stamp += 1
+
+    def _move_bees(self, bees, places):
+        """Move every bee in BEES to the matching entry of PLACES, in order."""
+        np.subtract.at(self._counts, self._bee_place[bees], 1)
+        np.add.at(self._counts, places, 1)
+        self._bee_place[bees] = places
+        self._bee_stamp[bees] = self._stamp + np.arange(len(bees))
+        self._stamp += len(bees)
+
+    def _damage_bees(self, bees, amount):
+        """Reduce the armor of every bee in BEES by AMOUNT, capping the damage
+        dealt to a Boss, and remove the bees that expire."""
+        if len(bees) == 0:
+            return
+        caps = self._bee_cap[bees]
+        self._bee_armor[bees] -= np.where(caps > 0, amount * caps / (caps + amount), amount)
+        expired = bees[self._bee_armor[bees] <= 0]
+        if len(expired):
+            places = self._bee_place[expired]
+            np.subtract.at(self._counts, places, 1)
+            self._bee_place[expired] = -1
+            if self._nearest is not None:
+                emptied = places[self._counts[places] == 0]
+                if len(emptied):
+                    self._refresh_nearest(np.unique(self._tunnel[emptied]))
+
+    def _bees_at(self, place):
+        """Return the indices of the bees in PLACE, in the order they arrived."""
+        bees = np.flatnonzero(self._bee_place == place)
+        return bees[np.argsort(self._bee_stamp[bees], kind='stable')]
+
+    def _random_bee(self, place):
+        """Return a random bee in PLACE, or -1 if PLACE has no bees."""
+        if self._counts[place] == 0:
+            return -1
+        return self.rng.choice(self._bees_at(place).tolist())
+
+    ############
+    # Strategy #
+    ############
+
+    def deploy_ant(self, place_name, ant_type_name):
+        """Place an ant if enough food is available and return its index.
+
+        This method is called by the current strategy to deploy ants.
+        """
+        constructor = self.ant_types[ant_type_name]
+        if self.food < constructor.food_cost:
+            print('Not enough food remains to place ' + ant_type_name)
+        else:
+            ant = self._new_ant(constructor)
+            place = self.places[place_name]
+            assert place != 0, 'Cannot add an ant to the Hive'
+            self._add_ant(place, ant)
+            self.food -= constructor.food_cost
+            return ant
+
+    def remove_ant(self, place_name):
+        """Remove an Ant from the Colony."""
+        ant = self._top[self.places[place_name]]
+        if ant >= 0:
+            self._remove_ant(ant)
+
+    def survivors(self, contained=True):
+        """Return a pair of lists of (name, armor, place name) triples: the
+        ants in places and the bees in places, ordered as AntColony.ants and
+        AntColony.bees. If CONTAINED is true, each container ant is followed
+        by the ant it contains, as in ants_batch.play_game."""
+        tops = self._top[:self._base]
+        tops = tops[tops >= 0]
+        ants = []
+        for a in tops:
+            ants.append(a)
+            if contained and self._ant_container[a] and self._ant_contained[a] >= 0:
+                ants.append(self._ant_contained[a])
+        ant_records = [(self._type_names[self._ant_type[a]], _number(self._ant_armor[a]),
+                        self._names[self._ant_place[a]]) for a in ants]
+        bees = np.flatnonzero(self._bee_place >= 0)
+        bees = bees[np.lexsort((self._bee_stamp[bees], self._bee_place[bees]))]
+        bee_records = [(self._bee_type_names[self._bee_type[b]], _number(self._bee_armor[b]),
+                        self._names[self._bee_place[b]]) for b in bees]
+        return ant_records, bee_records
+
+    def __str__(self):
+        status = ' (Food: {0}, Time: {1})'.format(self.food, self.time)
+        ant_records, bee_records = self.survivors(contained=False)
+        return str(['{0}({1}, {2})'.format(*r) for r in ant_records + bee_records]) + status
+
+def _number(value):
+    """Return a NumPy float as an int if it is integral, or as a float."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
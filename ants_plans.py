@@ -1,4 +1,5 @@
 from ants import *
+from collections import namedtuple
 
 ################
 #  Strategies  #
@@ -15,8 +16,76 @@ def interactive_strategy(colony):
     msg = '<Control>-D (<Control>-Z <Enter> on Windows) completes a turn.\n'
     interact(msg)
 
-def start_with_strategy(args, strategy):
-    """Reads command-line arguments and starts a game with those options."""
+def idle_strategy(colony):
+    """A strategy that never deploys any ants, used for headless games."""
+
+class ScriptedStrategy(object):
+    """A headless strategy that follows a fixed script of deployments.
+
+    The script is a list of (time, tunnel, step, ant_type_name) entries. The
+    place at STEP of TUNNEL is found by name, as in wet_layout and dry_layout.
+    Entries are skipped if their place does not exist or is occupied, or if
+    there is not enough food.
+    """
+
+    def __init__(self, script):
+        self.script = {}
+        for time, tunnel, step, ant_type_name in script:
+            self.script.setdefault(time, []).append((tunnel, step, ant_type_name))
+
+    def __call__(self, colony):
+        for tunnel, step, ant_type_name in self.script.get(colony.time, []):
+            name = 'tunnel_{0}_{1}'.format(tunnel, step)
+            if name not in colony.places:
+                name = 'water_{0}_{1}'.format(tunnel, step)
+            if name in colony.places:
+                try:
+                    colony.deploy_ant(name, ant_type_name)
+                except AssertionError:
+                    pass  # The place is already occupied
+
+    @property
+    def cache_key(self):
+        """The script as a sorted list, which identifies the strategy in
+        ants_cache."""
+        return sorted((time,) + entry for time, entries in self.script.items()
+                      for entry in entries)
+
+def thrower_script(tunnels, length, moat_frequency=0):
+    """Return a script that puts a HarvesterAnt at the back of each tunnel,
+    then deploys one thrower per turn, filling the tunnels back to front.
+    ScubaThrowers are used for the water places of wet_layout."""
+    script = [(0, tunnel, 0, 'Harvester') for tunnel in range(tunnels)]
+    for i in range(tunnels * (length - 1)):
+        step = 1 + i // tunnels
+        wet = moat_frequency != 0 and (step + 1) % moat_frequency == 0
+        script.append((i + 1, i % tunnels, step, 'Scuba' if wet else 'Thrower'))
+    return script
+
+def mixed_script(tunnels, length, moat_frequency=0):
+    """Return a script like thrower_script, but that cycles through every
+    kind of ant and deploys a QueenAnt in the middle of the first tunnel."""
+    kinds = ['Thrower', 'Wall', 'Fire', 'Short', 'Long', 'Tank', 'Ninja',
+             'Hungry', 'Bodyguard']
+    script = [(0, tunnel, 0, 'Harvester') for tunnel in range(tunnels)]
+    script.append((1, 0, length // 2, 'Queen'))
+    for i in range(tunnels * (length - 1)):
+        step = 1 + i // tunnels
+        wet = moat_frequency != 0 and (step + 1) % moat_frequency == 0
+        kind = 'Scuba' if wet else kinds[i % len(kinds)]
+        script.append((i + 2, i % tunnels, step, kind))
+    return script
+
+def start_with_strategy(args, strategy, play=None):
+    """Reads command-line arguments and starts a game with those options.
+
+    The game is played by PLAY, a function of the colony that returns True
+    if the ants win, or by the colony's simulate method if PLAY is None.
+    With --sweep, plays every combination of the given options headlessly
+    instead, as described in ants_sweep."""
+    if '--sweep' in args:
+        import ants_sweep
+        return ants_sweep.sweep(list(args))
     import argparse
     parser = argparse.ArgumentParser(description="Play Ants vs. SomeBees")
     parser.add_argument('-d', type=str, metavar='DIFFICULTY',
@@ -25,7 +94,9 @@ def start_with_strategy(args, strategy):
                         help='loads a full layout with water')
     parser.add_argument('--food', type=int,
                         help='number of food to start with when testing', default=2)
-    args = parser.parse_args()
+    parser.add_argument('--sweep', action='store_true',
+                        help='play many headless games; see ants_sweep.py --help')
+    args = parser.parse_args(list(args))
 
     assault_plan = make_normal_assault_plan()
     layout = dry_layout
@@ -53,7 +124,10 @@ def start_with_strategy(args, strategy):
 
     beehive = Hive(assault_plan)
     dimensions = (num_tunnels, tunnel_length)
-    return AntColony(strategy, beehive, ant_types(), layout, dimensions, food).simulate()
+    colony = AntColony(strategy, beehive, ant_types(), layout, dimensions, food)
+    if play is not None:
+        return play(colony)
+    return colony.simulate()
 
 #################
 # Assault Plans #
@@ -79,11 +153,134 @@ class AssaultPlan(dict):
         """Place all Bees in the beehive and return the list of Bees."""
         return [bee for wave in self.values() for bee in wave]
 
-def make_test_assault_plan():
-    return AssaultPlan().add_wave(Bee, 3, 2, 1).add_wave(Bee, 3, 3, 1)
+    @property
+    def num_pending(self):
+        """The number of Bees that have yet to be created, which is always 0
+        since add_wave creates every Bee."""
+        return 0
+
+    def release(self, time):
+        """Return the list of Bees that enter the colony at TIME."""
+        return self.get(time, [])
+
+    def save(self):
+        """Return what restore needs to return the plan to its current state,
+        which is None since an AssaultPlan never changes during a game."""
+
+    def restore(self, saved):
+        """Return the plan to the state in which save returned SAVED."""
+
+    def descriptors(self):
+        """Yield a (time, bee_type, armor) triple for every Bee of the plan,
+        in the order of all_bees."""
+        for time, wave in self.items():
+            for bee in wave:
+                yield time, type(bee), bee.armor
+
+Wave = namedtuple('Wave', ['bee_type', 'bee_armor', 'count'])
+
+class LazyAssaultPlan(AssaultPlan):
+    """An AssaultPlan that stores each wave as a Wave descriptor and only
+    creates its Bees when the Hive releases them.
+
+    A LazyAssaultPlan is a dictionary from times (int) to lists of Waves. It
+    may also draw waves from unbounded iterables, in which case the Bees can
+    never all be vanquished.
+
+    >>> plan = LazyAssaultPlan().add_wave(Bee, 3, 4, 2)
+    >>> plan
+    {4: [Wave(bee_type=<class 'ants.Bee'>, bee_armor=3, count=2)]}
+    >>> plan.num_pending
+    2
+    >>> plan.release(4)
+    [Bee(3, None), Bee(3, None)]
+    >>> plan.num_pending
+    0
+    """
+
+    def __init__(self):
+        self._pending = 0   # Bees in the stored waves
+        self._sources = []  # (next wave, iterator) pairs from add_waves
+
+    def add_wave(self, bee_type, bee_armor, time, count):
+        """Add a wave at time with count Bees that have the specified armor."""
+        self.setdefault(time, []).append(Wave(bee_type, bee_armor, count))
+        self._pending += count
+        return self
+
+    def add_waves(self, waves):
+        """Add every (bee_type, bee_armor, time, count) wave of the iterable
+        WAVES, in increasing order of time. WAVES is only advanced as far as
+        the current time of the game, so it may be unbounded.
+
+        >>> from itertools import count
+        >>> plan = LazyAssaultPlan().add_waves((Bee, 3, t, 1) for t in count(2))
+        >>> plan.num_pending
+        inf
+        >>> plan.release(3)
+        [Bee(3, None)]
+        """
+        waves = iter(waves)
+        wave = next(waves, None)
+        if wave is not None:
+            self._sources.append((wave, waves))
+        return self
+
+    @property
+    def all_bees(self):
+        """Return the empty list, since no Bee exists before it is released."""
+        return []
+
+    @property
+    def num_pending(self):
+        if self._sources:
+            return float('inf')
+        return self._pending
+
+    def release(self, time):
+        """Create and return the list of Bees that enter the colony at TIME."""
+        sources = []
+        for wave, waves in self._sources:
+            while wave is not None and wave[2] <= time:
+                self.add_wave(*wave)
+                wave = next(waves, None)
+            if wave is not None:
+                sources.append((wave, waves))
+        self._sources = sources
+        bees = []
+        for bee_type, bee_armor, count in self.pop(time, []):
+            bees.extend(bee_type(bee_armor) for _ in range(count))
+        self._pending -= len(bees)
+        return bees
+
+    def save(self):
+        if self._sources:
+            raise ValueError('an unbounded plan cannot be saved')
+        return tuple((time, tuple(waves)) for time, waves in self.items()), self._pending
+
+    def restore(self, saved):
+        waves, self._pending = saved
+        self.clear()
+        for time, wave in waves:
+            self[time] = list(wave)
+
+    def descriptors(self):
+        if self._sources:
+            raise ValueError('an unbounded plan has no complete list of Bees')
+        for time, waves in self.items():
+            for bee_type, bee_armor, count in waves:
+                for _ in range(count):
+                    yield time, bee_type, bee_armor
+
+def new_assault_plan(lazy=False):
+    """Return an empty LazyAssaultPlan if LAZY is true, or an AssaultPlan."""
+    return LazyAssaultPlan() if lazy else AssaultPlan()
+
+def make_test_assault_plan(lazy=False):
+    return new_assault_plan(lazy).add_wave(Bee, 3, 2, 1).add_wave(Bee, 3, 3, 1)
 
-def make_easy_assault_plan():
-    plan = AssaultPlan()
+def make_easy_assault_plan(lazy=False):
+    plan = new_assault_plan(lazy)
     for time in range(3, 16, 2):
         plan.add_wave(Bee, 3, time, 1)
     plan.add_wave(Wasp, 3, 4, 1)
@@ -92,8 +289,8 @@ def make_easy_assault_plan():
     plan.add_wave(Boss, 15, 16, 1)
     return plan
 
-def make_normal_assault_plan():
-    plan = AssaultPlan()
+def make_normal_assault_plan(lazy=False):
+    plan = new_assault_plan(lazy)
     for time in range(3, 16, 2):
         plan.add_wave(Bee, 3, time, 2)
     plan.add_wave(Wasp, 3, 4, 1)
@@ -111,8 +308,8 @@ def make_normal_assault_plan():
     plan.add_wave(Boss, 20, 30, 1)
     return plan
 
-def make_hard_assault_plan():
-    plan = AssaultPlan()
+def make_hard_assault_plan(lazy=False):
+    plan = new_assault_plan(lazy)
     for time in range(3, 16, 2):
         plan.add_wave(Bee, 4, time, 2)
     plan.add_wave(Hornet, 4, 4, 2)
@@ -130,8 +327,8 @@ def make_hard_assault_plan():
     plan.add_wave(Boss, 30, 30, 1)
     return plan
 
-def make_extra_hard_assault_plan():
-    plan = AssaultPlan()
+def make_extra_hard_assault_plan(lazy=False):
+    plan = new_assault_plan(lazy)
     plan.add_wave(Hornet, 5, 2, 2)
     for time in range(3, 16, 2):
         plan.add_wave(Bee, 5, time, 2)
@@ -154,6 +351,6 @@ def make_extra_hard_assault_plan():
 from utils import *
 @main
 def run(*args):
-    Insect.reduce_armor = class_method_wrapper(Insect.reduce_armor,
-            pre=print_expired_insects)
+    if '--sweep' not in args:  # Swept games print nothing of their own
+        event_bus.subscribe(print_expired, ['death'])
     start_with_strategy(args, interactive_strategy)
@@ -0,0 +1,170 @@
+"""A per-phase turn profiler for Ants Vs. SomeBees.
+
+Pass a TurnProfiler to AntColony.simulate to time each phase of every turn:
+the colony's strategy, the Hive's strategy, the ant actions and the bee
+actions. Ant and bee actions are also timed per insect class.
+
+>>> from ants_batch import GameConfig, make_colony
+>>> from ants_plans import make_test_assault_plan
+>>> colony = make_colony(GameConfig(make_test_assault_plan, dry_layout, (1, 9), seed=0))
+>>> profiler = TurnProfiler()
+>>> colony.simulate(profiler)
+The ant queen has perished. Please try again.
+False
+>>> len(profiler.turns)
+11
+>>> list(profiler.totals)
+['strategy', 'beehive.strategy', 'ants', 'bees']
+>>> sorted(profiler.class_totals['bees'])
+['Bee']
+
+Run this module to profile one of the benchmark games of ants_bench.py and
+write a trace in the Trace Event Format, which chrome://tracing, Perfetto and
+speedscope can load:
+
+    python3 ants_profile.py normal/wet/medium/mixed --trace trace.json
+"""
+
+import json
+import time
+from collections import OrderedDict
+
+from ants import *
+from ucb import main
+
+PHASES = ['strategy', 'beehive.strategy', 'ants', 'bees']
+
+class TurnProfiler(object):
+    """Records the wall time of each phase of each turn.
+
+    Attributes:
+    turns -- a list of dicts, one per turn, with the start time of the turn,
+             the seconds spent in each phase, and the seconds spent in the
+             actions of each insect class for the 'ants' and 'bees' phases
+    totals -- a dict from phase to total seconds
+    class_totals -- a dict from 'ants' or 'bees' to a dict from insect class
+                    name to total seconds
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.start = clock()
+        self.turns = []
+        self.totals = OrderedDict((phase, 0) for phase in PHASES)
+        self.class_totals = {'ants': {}, 'bees': {}}
+
+    def take_turn(self, colony):
+        """Play one turn of COLONY as AntColony.take_turn does, timing each
+        of its phase methods."""
+        clock = self.clock
+        ant_times, bee_times = {}, {}
+        turn = {'time': colony.time, 'start': clock() - self.start,
+                'phases': {}, 'classes': {'ants': ant_times, 'bees': bee_times}}
+        self.turns.append(turn)
+        phases = turn['phases']
+
+        def timed(phase, method, *args):
+            start = clock()
+            try:
+                method(*args)
+            finally:
+                phases[phase] = clock() - start
+
+        def timed_actions(times):
+            def act(insect):
+                start = clock()
+                try:
+                    insect.action(colony)
+                finally:
+                    name = type(insect).__name__
+                    times[name] = times.get(name, 0) + clock() - start
+            return act
+
+        try:
+            timed('strategy', colony.ants_deploy)
+            timed('beehive.strategy', colony.bees_invade)
+            timed('ants', colony.ants_take_actions, timed_actions(ant_times))
+            timed('bees', colony.bees_take_actions, timed_actions(bee_times))
+        finally:
+            self._add_totals(turn)
+
+    def _add_totals(self, turn):
+        for phase, seconds in turn['phases'].items():
+            self.totals[phase] += seconds
+        for phase, times in turn['classes'].items():
+            class_totals = self.class_totals[phase]
+            for name, seconds in times.items():
+                class_totals[name] = class_totals.get(name, 0) + seconds
+
+    def report(self):
+        """Return a string that summarizes where the time of all turns went."""
+        total = sum(self.totals.values()) or 1
+        lines = ['{0} turns, {1:.6f} seconds'.format(len(self.turns),
+                                                     sum(self.totals.values()))]
+        for phase, seconds in self.totals.items():
+            lines.append('  {0:20} {1:10.6f}s {2:6.1%}'.format(
+                phase, seconds, seconds / total))
+            times = self.class_totals.get(phase, {})
+            for name, seconds in sorted(times.items(), key=lambda t: -t[1]):
+                lines.append('    {0:18} {1:10.6f}s {2:6.1%}'.format(
+                    name, seconds, seconds / total))
+        return '\n'.join(lines)
+
+    def trace_events(self):
+        """Return a list of complete ('X') events in the Trace Event Format.
+
+        Each turn is an event that contains one event per phase. The insect
+        classes of a phase are laid end to end within it, since the actions of
+        each class are interleaved and only their totals are recorded.
+        """
+        def event(name, start, seconds, args=None):
+            e = {'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                 'ts': start * 1e6, 'dur': seconds * 1e6}
+            if args:
+                e['args'] = args
+            return e
+        events = []
+        for turn in self.turns:
+            start = turn['start']
+            events.append(event('turn', start, sum(turn['phases'].values()),
+                                {'time': turn['time']}))
+            for phase, seconds in turn['phases'].items():
+                events.append(event(phase, start, seconds))
+                class_start = start
+                for name, class_seconds in turn['classes'].get(phase, {}).items():
+                    events.append(event(name, class_start, class_seconds))
+                    class_start += class_seconds
+                start += seconds
+        return events
+
+    def save_trace(self, path):
+        """Write the trace events to the file at PATH as JSON."""
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(),
+                       'displayTimeUnit': 'ms'}, f)
+
+@main
+def run(*args):
+    import argparse
+    import contextlib
+    import os
+    from ants_bench import benchmark_cases
+    from ants_batch import make_colony
+    cases = dict(benchmark_cases())
+    parser = argparse.ArgumentParser(description="Profile Ants vs. SomeBees")
+    parser.add_argument('case', nargs='?', default='normal/dry/medium/mixed',
+                        help='a benchmark game of ants_bench.py, such as '
+                             'hard/wet/large/throwers')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write a per-turn trace to FILE as JSON')
+    args = parser.parse_args()
+    if args.case not in cases:
+        parser.error('unknown case {0}; choose from {1}'.format(
+            args.case, ', '.join(cases)))
+
+    profiler = TurnProfiler()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        make_colony(cases[args.case]).simulate(profiler)
+    print(profiler.report())
+    if args.trace:
+        profiler.save_trace(args.trace)
@@ -0,0 +1,336 @@
+"""Off-screen rendering of Ants Vs. SomeBees boards to image files.
+
+A Board is drawn with the layout of ants_gui: places from PLACE_POS in rows,
+insects from INSECT_FILES, leaves from leaf_coords, bees waiting at the hive
+and expired insects sliding into the crypt. scene turns a Board into a list
+of drawing operations without any Tk or image library:
+
+>>> board = Board([('Hive', None), ('tunnel_0_0', 'AntQueen'),
+...                ('tunnel_0_1', 'tunnel_0_0'), ('AntQueen', None)],
+...               [(1, 'Thrower', 'tunnel_0_0', True),
+...                (2, 'Bee', 'tunnel_0_1', False)], food=3, time=4)
+>>> place_points(board.places)['tunnel_0_1']
+(128, 180)
+>>> ops = scene(board)
+>>> [op[0] for op in ops].count('leaf')
+1
+>>> [op for op in ops if op[0] == 'text'][0]
+('text', (20, 20), 'Food: 3  Time: 4')
+
+draw rasterizes the operations with Pillow, which is the only requirement
+of this module beyond the standard library. render_replay renders the turns
+of an ants_replay log across a pool of worker processes, and
+render_thumbnails renders the last turn of many logs:
+
+    python3 ants_render.py game.antr --out frames --gif game.gif
+    python3 ants_render.py audit/*.antr --out thumbs --scale 0.25 --workers 8
+"""
+
+import os
+import random
+from collections import namedtuple
+from multiprocessing import Pool
+
+import ants
+from ants_gui import (INSECT_FILES, TUNNEL_FILE, ANT_IMAGE_WIDTH,
+                      ANT_IMAGE_HEIGHT, BEE_IMAGE_WIDTH, PANEL_PADDING,
+                      PLACE_PADDING, PLACE_POS, PANEL_POS, CRYPT, HIVE_HEIGHT,
+                      PLACE_MARGIN, LEAF_START_OFFSET, LEAF_END_OFFSET,
+                      LEAF_COLORS, leaf_coords)
+from graphics import shift_point, rectangle_points
+from ucb import main
+
+SIZE = (1100, 768)  # The size of a graphics.Canvas
+LEAF_LENGTH = 40
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+Board = namedtuple('Board', ['places', 'insects', 'food', 'time'])
+Board.__doc__ = """A board to draw.
+
+places -- a list of (name, exit name) pairs of the places, in the order of
+          colony.places, where the exit name is None for a place without one
+insects -- a list of (key, name, place name, is_ant) tuples, where NAME is
+           the insect's name attribute, such as 'Thrower'
+food -- the colony's food
+time -- the turn
+"""
+
+def colony_board(colony):
+    """Return the Board of an AntColony."""
+    contained = [a.contained_ant for a in colony.ants
+                 if a.is_container and a.contained_ant is not None]
+    insects = [(id(i), i.name, i.place.name, isinstance(i, ants.Ant))
+               for i in colony.insects + contained if i.place is not None]
+    places = [(place.name, place.exit and place.exit.name)
+              for place in colony.places.values()]
+    return Board(places, insects, colony.food, colony.time)
+
+def replay_board(replay, state):
+    """Return the Board of a ReplayState of an ants_replay.Replay."""
+    insects = [(i.id, getattr(ants, i.name).name, i.place, i.is_ant)
+               for i in state.insects.values()]
+    places = [(name, replay.places[exit] if exit >= 0 else None)
+              for name, exit in zip(replay.places, replay.exits)]
+    return Board(places, insects, state.food, state.turns)
+
+##########
+# Layout #
+##########
+
+PLACE_WIDTH = BEE_IMAGE_WIDTH + 2 * PLACE_PADDING[0]
+PLACE_HEIGHT = ANT_IMAGE_HEIGHT + 2 * PLACE_PADDING[1]
+
+def place_rows(places):
+    """Return a list of the tunnels in PLACES, each a list of place names from
+    the queen to the hive. As in AntsGUI._init_places, a tunnel starts at each
+    place whose exit is the queen, whatever its name.
+
+    >>> place_rows([('Hive', None), ('left', 'AntQueen'), ('far', 'left'),
+    ...             ('right', 'AntQueen'), ('AntQueen', None)])
+    [['left', 'far'], ['right']]
+    """
+    rows = []
+    for name, exit in places:
+        if name in ('Hive', 'AntQueen'):
+            continue
+        if exit == 'AntQueen' or not rows:
+            rows.append([])
+        rows[-1].append(name)
+    return rows
+
+def place_points(places):
+    """Return a dict from each place name in PLACES to its top-left corner,
+    laid out as in AntsGUI._init_places, with the hive after the last place."""
+    points = {}
+    for row, names in enumerate(place_rows(places)):
+        place_pos = shift_point(PLACE_POS, (0, row * (PLACE_HEIGHT + PLACE_MARGIN)))
+        for name in names:
+            points[name] = place_pos
+            place_pos = shift_point(place_pos, (PLACE_WIDTH + PLACE_MARGIN, 0))
+    points['Hive'] = (place_pos[0] + PLACE_WIDTH, HIVE_HEIGHT)
+    return points
+
+def thrower_ranges():
+    """Return a dict from the name of every kind of ThrowerAnt to its
+    (min_range, max_range)."""
+    ranges, kinds = {}, [ants.ThrowerAnt]
+    while kinds:
+        kind = kinds.pop()
+        ranges[kind.name] = (kind.min_range, kind.max_range)
+        kinds.extend(kind.__subclasses__())
+    return ranges
+
+def leaf_target(row, place, bee_places, min_range, max_range):
+    """Return the place in ROW that a thrower at PLACE throws at, by the rule
+    of ThrowerAnt.nearest_bee: the nearest place towards the hive holding bees
+    between MIN_RANGE (inclusive) and MAX_RANGE (exclusive) places away, or
+    else PLACE itself if it holds bees. Return None if there is no target.
+
+    >>> row = ['tunnel_0_{0}'.format(i) for i in range(8)]
+    >>> leaf_target(row, row[0], {row[2], row[6]}, 0, 4)
+    'tunnel_0_2'
+    >>> leaf_target(row, row[0], {row[2], row[6]}, 5, float('inf'))
+    'tunnel_0_6'
+    >>> print(leaf_target(row, row[1], {row[6]}, 0, 4))
+    None
+    """
+    for distance, target in enumerate(row[row.index(place):]):
+        if min_range <= distance < max_range and target in bee_places:
+            return target
+    if place in bee_places:
+        return place
+
+def hive_offset(key):
+    """The random offset of a bee in the hive, fixed for each insect KEY."""
+    rng = random.Random(key)
+    return rng.randint(-10, 10), rng.randint(-50, 50)
+
+def scene(board, previous=None):
+    """Return a list of drawing operations for BOARD, in drawing order:
+
+    ('polygon', points, outline color, fill color)
+    ('image', position, image file, insect name or None)
+    ('text', position, text)
+    ('leaf', points, fill color)
+
+    Insects of the PREVIOUS board that are gone from BOARD are drawn in the
+    crypt, and every ThrowerAnt throws a leaf at the bees it targets."""
+    points = place_points(board.places)
+    ops = [('text', (20, 20), 'Food: {0}  Time: {1}'.format(board.food, board.time))]
+
+    # Control panel
+    panel_pos = PANEL_POS
+    width = ANT_IMAGE_WIDTH + 2 * PANEL_PADDING[0]
+    height = ANT_IMAGE_HEIGHT + 6 + 2 * PANEL_PADDING[1]
+    for ant_type in ants.ant_types():
+        ops.append(('polygon', rectangle_points(panel_pos, width, height),
+                    'Black', 'White'))
+        ops.append(('image', shift_point(panel_pos, PANEL_PADDING),
+                    INSECT_FILES[ant_type.name], ant_type.name))
+        panel_pos = shift_point(panel_pos, (width + 2, 0))
+
+    # Places
+    for name, pos in points.items():
+        if name != 'Hive':
+            color = 'Blue' if name.startswith('water') else 'White'
+            ops.append(('polygon', rectangle_points(pos, PLACE_WIDTH, PLACE_HEIGHT),
+                        'Black', color))
+            ops.append(('image', pos, TUNNEL_FILE, None))
+
+    # Insects, with containers in front of the ants they contain
+    def position(key, place):
+        pos = shift_point(points[place], PLACE_PADDING)
+        if place == 'Hive':
+            pos = shift_point(pos, hive_offset(key))
+        return pos
+    containers = {t.name for t in ants.ant_types() if t.is_container}
+    drawn = sorted((i for i in board.insects if i[2] in points),
+                   key=lambda i: i[3] and i[1] in containers)
+    for key, name, place, is_ant in drawn:
+        ops.append(('image', position(key, place), INSECT_FILES[name], name))
+    if previous is not None:
+        keys = {i[0] for i in board.insects}
+        for key, name, place, is_ant in previous.insects:
+            if key not in keys and place in points and place != 'Hive':
+                ops.append(('image', (points[place][0], CRYPT), INSECT_FILES[name], name))
+
+    # Leaves, halfway to their targets
+    rows = {name: row for row in place_rows(board.places) for name in row}
+    ranges = thrower_ranges()
+    bee_places = {i[2] for i in board.insects if not i[3]}
+    for key, name, place, is_ant in board.insects:
+        if not is_ant or name not in ranges or place not in rows:
+            continue
+        target = leaf_target(rows[place], place, bee_places, *ranges[name])
+        if target is not None:
+            start = shift_point(points[place], LEAF_START_OFFSET)
+            end = shift_point(points[target], LEAF_END_OFFSET)
+            middle = tuple((s + e) / 2 for s, e in zip(start, end))
+            ops.append(('leaf', leaf_coords(middle, 0, LEAF_LENGTH), LEAF_COLORS[name]))
+    return ops
+
+###########
+# Drawing #
+###########
+
+_sprites = {}  # Image files loaded in this process, or None if missing
+
+def sprite(image_file):
+    from PIL import Image
+    if image_file not in _sprites:
+        path = os.path.join(ROOT, image_file)
+        _sprites[image_file] = Image.open(path).convert('RGBA') if os.path.exists(path) else None
+    return _sprites[image_file]
+
+def draw(ops, scale=1):
+    """Return a Pillow Image of the drawing operations OPS. Insects whose
+    image files are missing are drawn as labeled boxes."""
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', SIZE, 'White')
+    pen = ImageDraw.Draw(image)
+    for op in ops:
+        kind = op[0]
+        if kind == 'polygon':
+            pen.polygon(op[1], outline=op[2], fill=op[3])
+        elif kind == 'text':
+            pen.text(op[1], op[2], fill='Black')
+        elif kind == 'leaf':
+            pen.polygon(op[1], outline='DarkGreen', fill=op[2])
+        elif kind == 'image':
+            pos, image_file, name = op[1], op[2], op[3]
+            pos = tuple(int(x) for x in pos)
+            picture = sprite(image_file)
+            if picture is not None:
+                image.paste(picture, pos, picture)
+            elif name is not None:
+                box = (pos[0], pos[1], pos[0] + BEE_IMAGE_WIDTH, pos[1] + ANT_IMAGE_HEIGHT // 2)
+                pen.rectangle(box, outline='Black', fill='Khaki')
+                pen.text((pos[0] + 2, pos[1] + 2), name, fill='Black')
+    if scale != 1:
+        image = image.resize((int(SIZE[0] * scale), int(SIZE[1] * scale)))
+    return image
+
+###########
+# Replays #
+###########
+
+_replays = {}  # Replays opened in this process
+
+def _render_turn(job):
+    """Render turn TURN of the replay log at PATH to the image file OUT."""
+    from ants_replay import Replay
+    path, turn, out, scale = job
+    if path not in _replays:
+        _replays[path] = Replay(path)
+    replay = _replays[path]
+    board = replay_board(replay, replay.state_at(turn))
+    previous = replay_board(replay, replay.state_at(turn - 1)) if turn > 0 else None
+    draw(scene(board, previous), scale).save(out)
+    return out
+
+def render_jobs(jobs, workers=None):
+    """Render (path, turn, out, scale) jobs across WORKERS processes and
+    return the image files, in order."""
+    if workers == 1:
+        return [_render_turn(job) for job in jobs]
+    with Pool(workers) as pool:
+        return pool.map(_render_turn, jobs, chunksize=4)
+
+def render_replay(path, out_dir, turns=None, workers=None, scale=1):
+    """Render TURNS (by default every turn) of the replay log at PATH to PNG
+    files in OUT_DIR, and return their file names in turn order."""
+    from ants_replay import Replay
+    if turns is None:
+        turns = range(Replay(path).turns + 1)
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    jobs = [(path, turn, os.path.join(out_dir, '{0}_{1:04}.png'.format(stem, turn)), scale)
+            for turn in turns]
+    return render_jobs(jobs, workers)
+
+def render_thumbnails(paths, out_dir, workers=None, scale=0.25):
+    """Render the last turn of every replay log in PATHS to a PNG file in
+    OUT_DIR, and return the file names."""
+    from ants_replay import Replay
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        jobs.append((path, Replay(path).turns,
+                     os.path.join(out_dir, stem + '.png'), scale))
+    return render_jobs(jobs, workers)
+
+def save_gif(frames, path, seconds_per_frame=0.5):
+    """Combine the image files FRAMES into an animated GIF at PATH."""
+    from PIL import Image
+    images = [Image.open(frame) for frame in frames]
+    images[0].save(path, save_all=True, append_images=images[1:],
+                   duration=int(seconds_per_frame * 1000), loop=0)
+
+@main
+def run(*args):
+    import argparse
+    parser = argparse.ArgumentParser(description="Render replay logs to images")
+    parser.add_argument('replays', nargs='+', help='ants_replay log files')
+    parser.add_argument('--out', default='frames', help='the output directory')
+    parser.add_argument('--turn', type=int, action='append',
+                        help='a turn to render (defaults to every turn of one '
+                             'log, or the last turn of several)')
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--gif', metavar='FILE',
+                        help='also combine the frames of one log into FILE')
+    parser.add_argument('--seconds', type=float, default=0.5,
+                        help='seconds per frame of the GIF')
+    args = parser.parse_args()
+
+    if len(args.replays) == 1 or args.turn:
+        frames = []
+        for path in args.replays:
+            frames.extend(render_replay(path, args.out, args.turn, args.workers,
+                                        args.scale))
+    else:
+        frames = render_thumbnails(args.replays, args.out, args.workers, args.scale)
+    if args.gif:
+        save_gif(frames, args.gif, args.seconds)
+    print('{0} frames written to {1}'.format(len(frames), args.out))
@@ -0,0 +1,404 @@
+"""Compact binary replay logs of Ants Vs. SomeBees games.
+
+A Recorder subscribes to ants.event_bus and writes every deployment, spawn,
+move, damage, death and removal of a game to a binary log, along with a
+snapshot of the whole board every few turns. A Replay reads the log back and
+reconstructs the board after any turn from the nearest earlier snapshot,
+without calling any action() method:
+
+>>> import os, tempfile
+>>> from ants_batch import GameConfig, make_colony
+>>> from ants_plans import make_easy_assault_plan, thrower_script, ScriptedStrategy
+>>> config = GameConfig(make_easy_assault_plan, dry_layout, (2, 9), 20,
+...                     ScriptedStrategy(thrower_script(2, 9)), seed=1)
+>>> colony = make_colony(config)
+>>> path = os.path.join(tempfile.mkdtemp(), 'game.antr')
+>>> record_game(colony, path, snapshot_every=5)
+All bees are vanquished. You win!
+True
+>>> replay = Replay(path)
+>>> replay.winner, replay.turns, replay.snapshots
+('ants', 19, [0, 5, 10, 15])
+>>> state = replay.state_at(replay.turns)
+>>> state.food == colony.food
+True
+>>> sorted((a.name, a.armor, a.place) for a in state.ants) == sorted(
+...     (type(a).__name__, a.armor, a.place.name) for a in colony.ants)
+True
+
+Run this module to print the board of a log after a given turn:
+
+    python3 ants_replay.py game.antr --turn 12
+"""
+
+import struct
+from bisect import bisect_right
+
+from ants import *
+from ucb import main
+
+MAGIC = b'ANTR'
+INDEX_MAGIC = b'ANTI'
+VERSION = 2
+
+# Record codes. Each record is its one-byte code followed by its fields.
+SPAWN = 1     # insect id, type index, place id, armor
+DEPLOY = 2    # insect id, type index, place id, armor
+MOVE = 3      # insect id, place id
+DAMAGE = 4    # insect id, armor after the damage
+DEATH = 5     # insect id
+REMOVE = 6    # insect id
+TURN = 7      # turns played, food
+SNAPSHOT = 8  # turns played, food, insect count, then an insect per SPAWN
+END = 9       # 1 if the ants won or 0 if the bees won, turns played
+
+_PLACE = struct.Struct('<hB')  # exit id or -1, name length; then the name
+_INSECT = struct.Struct('<IBHd')
+_MOVE = struct.Struct('<IH')
+_DAMAGE = struct.Struct('<Id')
+_ID = struct.Struct('<I')
+_TURN = struct.Struct('<Ii')
+_SNAPSHOT = struct.Struct('<IiI')
+_END = struct.Struct('<BI')
+_INDEX_ENTRY = struct.Struct('<IQ')
+_TRAILER = struct.Struct('<Q4s')
+
+############
+# Recorder #
+############
+
+class Recorder(object):
+    """Writes the events of one colony's game to a replay log.
+
+    A snapshot of the board is written before the first turn and after every
+    SNAPSHOT_EVERY turns. The log ends with an index of the snapshot offsets
+    and a table of the insect classes. Events of other colonies, such as
+    those played alongside on an ants_loop.GameLoop, are ignored:
+
+    >>> import os, tempfile
+    >>> from ants_plans import make_test_assault_plan
+    >>> def new_colony():
+    ...     return AntColony(lambda colony: None, Hive(make_test_assault_plan()),
+    ...                      ant_types(), dry_layout, (1, 9), seed=1)
+    >>> colony, other = new_colony(), new_colony()
+    >>> recorder = Recorder(colony, os.path.join(tempfile.mkdtemp(), 'game.antr'))
+    >>> recorder.start()
+    >>> size = recorder.file.tell()
+    >>> other.simulate()
+    The ant queen has perished. Please try again.
+    False
+    >>> recorder.file.tell() == size, recorder.file.closed
+    (True, False)
+    >>> colony.simulate()
+    The ant queen has perished. Please try again.
+    False
+    >>> recorder.file.closed
+    True
+    """
+
+    def __init__(self, colony, path, snapshot_every=10):
+        self.colony = colony
+        self.snapshot_every = snapshot_every
+        self.file = open(path, 'wb')
+        self.ids = {}      # Insect -> id
+        self.types = {}    # Insect class -> type index
+        self.turns = None  # Turns played as of the last TURN record
+        self.index = []    # (turns, offset) pairs of the snapshots
+        topology = colony.topology
+        self.file.write(MAGIC + struct.pack('<BH', VERSION, len(topology.places)))
+        for place, exit in zip(topology.places, topology.exits):
+            name = place.name.encode()
+            self.file.write(_PLACE.pack(exit, len(name)) + name)
+
+    def start(self):
+        """Write the first snapshot and start recording events."""
+        self.snapshot(self.colony.time)
+        event_bus.subscribe(self)
+
+    def __call__(self, kind, *args):
+        if event_colony(kind, args) is self.colony:  # Not another game's
+            getattr(self, 'on_' + kind)(*args)
+
+    def _type(self, insect):
+        """Return the type index of the class of INSECT."""
+        cls = type(insect)
+        index = self.types.get(cls)
+        if index is None:
+            index = self.types[cls] = len(self.types)
+        return index
+
+    def _id(self, insect, code=SPAWN):
+        """Return the id of INSECT, writing a record of kind CODE for it if it
+        has not been seen before."""
+        insect_id = self.ids.get(insect)
+        if insect_id is None:
+            insect_id = self.ids[insect] = len(self.ids)
+            type_index = self._type(insect)
+            self.file.write(bytes([code]) + _INSECT.pack(
+                insect_id, type_index, insect.place.id, insect.armor))
+        return insect_id
+
+    def snapshot(self, turns):
+        """Write a SNAPSHOT record of every insect on the board."""
+        insects = []
+        for place in self.colony.topology.places:
+            if place.ant is not None:
+                insects.append(place.ant)
+                contained = getattr(place.ant, 'contained_ant', None)
+                if contained is not None:
+                    insects.append(contained)
+            insects.extend(place.bees)
+        records = []
+        for insect in insects:
+            if insect not in self.ids:
+                self.ids[insect] = len(self.ids)
+            records.append(_INSECT.pack(self.ids[insect], self._type(insect),
+                                        insect.place.id, insect.armor))
+        self.index.append((turns, self.file.tell()))
+        self.file.write(bytes([SNAPSHOT]) + _SNAPSHOT.pack(
+            turns, self.colony.food, len(records)) + b''.join(records))
+
+    def on_deploy(self, ant, place):
+        self._id(ant, DEPLOY)
+
+    def on_move(self, bee, origin, destination):
+        if bee not in self.ids:  # Spawned in the Hive
+            self.ids[bee] = len(self.ids)
+            self.file.write(bytes([SPAWN]) + _INSECT.pack(
+                self.ids[bee], self._type(bee), origin.id, bee.armor))
+        self.file.write(bytes([MOVE]) + _MOVE.pack(self.ids[bee], destination.id))
+
+    def on_damage(self, insect, amount):
+        self.file.write(bytes([DAMAGE]) + _DAMAGE.pack(self._id(insect),
+                                                       insect.armor))
+
+    def on_death(self, insect, place):
+        self.file.write(bytes([DEATH]) + _ID.pack(self._id(insect)))
+
+    def on_remove(self, ant, place):
+        if ant.place is None:  # The true QueenAnt cannot be removed
+            self.file.write(bytes([REMOVE]) + _ID.pack(self._id(ant)))
+
+    def on_throw(self, thrower, target):
+        pass  # A throw is recorded as the damage it does
+
+    def on_turn(self, colony):
+        self.turns = colony.time + 1
+        self.file.write(bytes([TURN]) + _TURN.pack(self.turns, colony.food))
+        if self.turns % self.snapshot_every == 0:
+            self.snapshot(self.turns)
+
+    def on_end(self, colony):
+        """Write the END record and the index of snapshots, then close."""
+        event_bus.unsubscribe(self)
+        queen_place = colony.topology.places[-1]
+        for bee in colony.active_bees:
+            if bee.place is None and bee.armor > 0:  # Entered the QueenPlace
+                self.file.write(bytes([MOVE]) + _MOVE.pack(self.ids[bee],
+                                                           queen_place.id))
+        if self.turns != colony.time + 1:  # The game ended within a turn
+            self.turns = colony.time + 1
+            self.file.write(bytes([TURN]) + _TURN.pack(self.turns, colony.food))
+        ants_won = colony.num_bees == 0 and not colony.active_bees
+        self.file.write(bytes([END]) + _END.pack(ants_won, self.turns))
+        index_offset = self.file.tell()
+        self.file.write(_ID.pack(len(self.index)))
+        for entry in self.index:
+            self.file.write(_INDEX_ENTRY.pack(*entry))
+        self.file.write(struct.pack('<B', len(self.types)))
+        for cls in self.types:  # In order of type index
+            name = cls.__name__.encode()
+            self.file.write(struct.pack('<BB', cls.is_ant, len(name)) + name)
+        self.file.write(_TRAILER.pack(index_offset, INDEX_MAGIC))
+        self.file.close()
+
+def record_game(colony, path, snapshot_every=10):
+    """Play the game of COLONY, recording it to a replay log at PATH, and
+    return whether the ants won."""
+    recorder = Recorder(colony, path, snapshot_every)
+    recorder.start()
+    return colony.simulate()
+
+##########
+# Replay #
+##########
+
+class ReplayInsect(object):
+    """An insect of a replayed board, which holds no behavior."""
+
+    __slots__ = ('id', 'name', 'is_ant', 'place', 'armor')
+
+    def __init__(self, id, name, is_ant, place, armor):
+        self.id = id
+        self.name = name      # The name of the insect's class
+        self.is_ant = is_ant
+        self.place = place    # The name of the insect's Place
+        self.armor = armor
+
+    def __repr__(self):
+        return '{0}({1}, {2})'.format(self.name, self.armor, self.place)
+
+class ReplayState(object):
+    """The board of a replayed game after some number of turns.
+
+    Attributes:
+    turns -- the number of turns played
+    food -- the colony's food
+    insects -- a dict from insect id to the ReplayInsect of every insect
+    """
+
+    def __init__(self, turns, food):
+        self.turns = turns
+        self.food = food
+        self.insects = {}
+
+    @property
+    def ants(self):
+        return [i for i in self.insects.values() if i.is_ant]
+
+    @property
+    def bees(self):
+        return [i for i in self.insects.values() if not i.is_ant]
+
+    def __str__(self):
+        return 'Turn {0}, food {1}: {2}'.format(
+            self.turns, self.food, sorted(self.insects.values(), key=repr))
+
+class Replay(object):
+    """A replay log, read back into ReplayStates.
+
+    Attributes:
+    places -- the names of the places, indexed by place id
+    exits -- the id of the exit of each place, or -1 if it has none
+    snapshots -- the numbers of turns after which a snapshot was taken
+    winner -- 'ants' or 'bees'
+    turns -- the number of turns in the game
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = data = f.read()
+        if data[:4] != MAGIC or data[4] != VERSION:
+            raise ValueError('{0} is not a version {1} replay log'.format(
+                path, VERSION))
+        count, = struct.unpack_from('<H', data, 5)
+        offset = 7
+        self.places, self.exits = [], []
+        for _ in range(count):
+            exit, length = _PLACE.unpack_from(data, offset)
+            offset += _PLACE.size
+            self.places.append(data[offset:offset + length].decode())
+            self.exits.append(exit)
+            offset += length
+
+        index_offset, magic = _TRAILER.unpack_from(data, len(data) - _TRAILER.size)
+        if magic != INDEX_MAGIC:
+            raise ValueError('{0} is incomplete'.format(path))
+        count, = _ID.unpack_from(data, index_offset)
+        entries = [_INDEX_ENTRY.unpack_from(data, index_offset + 4 + i * _INDEX_ENTRY.size)
+                   for i in range(count)]
+        offset = index_offset + 4 + count * _INDEX_ENTRY.size
+        self.types = []  # (name, is_ant) pairs, indexed by type index
+        for _ in range(data[offset]):
+            is_ant, length = data[offset + 1], data[offset + 2]
+            name = data[offset + 3:offset + 3 + length].decode()
+            self.types.append((name, bool(is_ant)))
+            offset += 2 + length
+        self.snapshots = [turns for turns, _ in entries]
+        self._offsets = [offset for _, offset in entries]
+        self._end = index_offset
+        ants_won, self.turns = _END.unpack_from(data, index_offset - _END.size)
+        self.winner = 'ants' if ants_won else 'bees'
+
+    def _records(self, offset, end):
+        """Yield (code, fields) pairs for the records from OFFSET until the
+        END record or the offset END."""
+        data = self.data
+        while offset < end:
+            code = data[offset]
+            offset += 1
+            if code == SPAWN or code == DEPLOY:
+                yield code, _INSECT.unpack_from(data, offset)
+                offset += _INSECT.size
+            elif code == MOVE:
+                yield code, _MOVE.unpack_from(data, offset)
+                offset += _MOVE.size
+            elif code == DAMAGE:
+                yield code, _DAMAGE.unpack_from(data, offset)
+                offset += _DAMAGE.size
+            elif code == DEATH or code == REMOVE:
+                yield code, _ID.unpack_from(data, offset)
+                offset += _ID.size
+            elif code == TURN:
+                yield code, _TURN.unpack_from(data, offset)
+                offset += _TURN.size
+            elif code == SNAPSHOT:
+                turns, food, count = _SNAPSHOT.unpack_from(data, offset)
+                offset += _SNAPSHOT.size
+                insects = [_INSECT.unpack_from(data, offset + i * _INSECT.size)
+                           for i in range(count)]
+                offset += count * _INSECT.size
+                yield code, (turns, food, insects)
+            elif code == END:
+                return
+            else:
+                raise ValueError('unknown record {0} at {1}'.format(code, offset - 1))
+
+    def _insect(self, insect_id, type_index, place_id, armor):
+        name, is_ant = self.types[type_index]
+        return ReplayInsect(insect_id, name, is_ant, self.places[place_id],
+                            _armor(armor))
+
+    def frames(self, start=0):
+        """Yield the ReplayState after each turn from turn START to the end of
+        the game. The same ReplayState is updated and yielded each time."""
+        i = bisect_right(self.snapshots, start) - 1
+        if i < 0:
+            raise ValueError('no snapshot precedes turn {0}'.format(start))
+        state = None
+        for code, fields in self._records(self._offsets[i], self._end):
+            if code == SNAPSHOT:
+                if state is None:  # Later snapshots repeat the replayed state
+                    turns, food, insects = fields
+                    state = ReplayState(turns, food)
+                    for fields in insects:
+                        state.insects[fields[0]] = self._insect(*fields)
+                    if turns >= start:
+                        yield state
+            elif code == TURN:
+                state.turns, state.food = fields
+                if state.turns >= start:
+                    yield state
+            elif code == SPAWN or code == DEPLOY:
+                state.insects[fields[0]] = self._insect(*fields)
+            elif code == MOVE:
+                state.insects[fields[0]].place = self.places[fields[1]]
+            elif code == DAMAGE:
+                state.insects[fields[0]].armor = _armor(fields[1])
+            elif code == DEATH or code == REMOVE:
+                state.insects.pop(fields[0], None)
+
+    def state_at(self, turns):
+        """Return the ReplayState after TURNS turns, replayed from the nearest
+        snapshot."""
+        if not 0 <= turns <= self.turns:
+            raise ValueError('the game has turns 0 to {0}'.format(self.turns))
+        for state in self.frames(turns):
+            return state
+
+def _armor(armor):
+    """Return ARMOR as an int if it is whole, as most armor is."""
+    return int(armor) if armor.is_integer() else armor
+
+@main
+def run(*args):
+    import argparse
+    parser = argparse.ArgumentParser(description="Replay Ants vs. SomeBees")
+    parser.add_argument('log', help='a replay log written by a Recorder')
+    parser.add_argument('--turn', type=int,
+                        help='the number of turns played (defaults to all)')
+    args = parser.parse_args()
+    replay = Replay(args.log)
+    turn = replay.turns if args.turn is None else args.turn
+    print('{0} turns, {1} won'.format(replay.turns, replay.winner))
+    print(replay.state_at(turn))
@@ -0,0 +1,313 @@
+"""A headless search strategy for Ants Vs. SomeBees.
+
+SearchStrategy chooses each turn's deployments by beam search. Every
+candidate sequence of deploy_ant and remove_ant actions is scored by rolling
+the game out a few turns on a clone of the colony, restoring the clone from a
+snapshot between rollouts. Rollouts may be spread over a pool of worker
+processes, and each turn's search stops when its time budget runs out.
+
+>>> from ants_batch import GameConfig, make_colony
+>>> from ants_plans import make_easy_assault_plan
+>>> strategy = SearchStrategy(time_budget=5, horizon=6)
+>>> colony = make_colony(GameConfig(make_easy_assault_plan, dry_layout, (2, 9),
+...                                 food=10, strategy=strategy, seed=1))
+>>> colony.simulate()
+All bees are vanquished. You win!
+True
+
+Rollouts are muted on ants.event_bus, so its sinks only receive the events of
+the game itself, while any other game in the process is still heard:
+
+>>> colonies = set()
+>>> def sink(kind, *args):
+...     colonies.add(event_colony(kind, args))
+>>> event_bus.subscribe(sink)
+>>> from ants_plans import make_test_assault_plan
+>>> strategy = SearchStrategy(time_budget=5, horizon=4)
+>>> colony = make_colony(GameConfig(make_test_assault_plan, dry_layout, (1, 9),
+...                                 food=4, strategy=strategy, seed=1))
+>>> colony.simulate()
+All bees are vanquished. You win!
+True
+>>> colonies == {colony}, event_bus.muted
+(True, set())
+>>> event_bus.unsubscribe(sink)
+
+Run this module to watch it play:
+
+    python3 ants_search.py hard --tunnels 4 --workers 4 --budget 0.5
+"""
+
+import contextlib
+import os
+import pickle
+import random
+import time
+from multiprocessing import Pool
+
+from ants import *
+from ants_plans import idle_strategy
+from ucb import main
+
+WIN_SCORE = 1e6
+
+def evaluate(colony, winner):
+    """Score COLONY after a rollout that ended with WINNER ('ants', 'bees' or
+    None if the game goes on). Higher is better for the ants: wins beat
+    everything, then the armor of the bees in the tunnels, weighted up as
+    they near the queen, then the colony's food."""
+    if winner == 'ants':
+        return WIN_SCORE - colony.time
+    if winner == 'bees':
+        return -WIN_SCORE + colony.time
+    threat = 0
+    for bee in colony.active_bees:
+        if bee.armor > 0 and bee.place is not None and bee.place.depth is not None:
+            threat += bee.armor * (1 + 4 / (1 + bee.place.depth))
+    return colony.food - threat
+
+def thrower_policy(colony):
+    """The default policy of rollouts, which spends food on throwers as soon
+    as it can, in the empty place nearest the queen of each tunnel in turn.
+    Throwers missing from the colony's ant types are never deployed.
+
+    >>> from ants_plans import make_test_assault_plan
+    >>> colony = AntColony(None, Hive(make_test_assault_plan()), [ThrowerAnt],
+    ...                    wet_layout, (2, 9), food=10, seed=1)
+    >>> thrower_policy(colony)
+    >>> colony.ants
+    [ThrowerAnt(1, tunnel_0_0), ThrowerAnt(1, tunnel_1_0)]
+    """
+    thrower, scuba = colony.ant_types.get('Thrower'), colony.ant_types.get('Scuba')
+    costs = [ant_type.food_cost for ant_type in (thrower, scuba) if ant_type]
+    for tunnel in colony.tunnels:
+        if not costs or colony.food < min(costs):
+            return
+        for place in tunnel.places:
+            if place.ant is None:
+                ant_type = scuba if isinstance(place, Water) else thrower
+                if ant_type is not None and colony.food >= ant_type.food_cost:
+                    colony.deploy_ant(place.name, ant_type.name)
+                break
+
+class SearchStrategy(object):
+    """A strategy that searches for each turn's actions.
+
+    time_budget -- seconds of search per turn
+    horizon -- turns played by each rollout
+    beam_width -- action sequences kept at each depth of the beam
+    max_actions -- the most actions taken in one turn
+    places_per_tunnel -- empty places considered per tunnel, nearest the queen
+    rollouts -- rollouts per candidate, each with its own random seed
+    policy -- the strategy that deploys ants during rollouts
+    workers -- processes that play rollouts, or None to play them here
+    allow_remove -- whether to consider removing ants
+    evaluate -- a function from a colony and a winner to a score
+    """
+
+    def __init__(self, time_budget=1.0, horizon=10, beam_width=4, max_actions=2,
+                 places_per_tunnel=2, rollouts=1, policy=thrower_policy,
+                 workers=None, allow_remove=False, evaluate=evaluate):
+        self.time_budget = time_budget
+        self.horizon = horizon
+        self.beam_width = beam_width
+        self.max_actions = max_actions
+        self.places_per_tunnel = places_per_tunnel
+        self.rollouts = rollouts
+        self.policy = policy
+        self.workers = workers
+        self.allow_remove = allow_remove
+        self.evaluate = evaluate
+        self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None  # Pools stay in the process that made them
+        return state
+
+    def __call__(self, colony):
+        deadline = time.monotonic() + self.time_budget
+        data = clone_data(colony)
+        beam = [()]
+        best, best_score = (), None
+        for depth in range(self.max_actions):
+            candidates = [seq + (action,) for seq in beam
+                          for action in self.actions(colony, seq)]
+            if depth == 0:
+                candidates.insert(0, ())  # Doing nothing is always scored
+            scored = self.score(data, candidates, deadline)
+            if not scored:
+                break
+            order = {seq: i for i, seq in enumerate(candidates)}
+            scored.sort(key=lambda pair: (-pair[1], order[pair[0]]))
+            if best_score is None or scored[0][1] > best_score:
+                best, best_score = scored[0]
+            beam = [seq for seq, _ in scored[:self.beam_width] if seq]
+            if not beam or time.monotonic() >= deadline:
+                break
+        for action in best:
+            apply_action(colony, action)
+
+    def actions(self, colony, seq):
+        """Return the actions that may follow the sequence SEQ this turn."""
+        used = {action[1] for action in seq}
+        food = colony.food - sum(colony.ant_types[action[2]].food_cost
+                                 for action in seq if action[0] == 'deploy')
+        affordable = [name for name, ant_type in colony.ant_types.items()
+                      if ant_type.food_cost <= food]
+        actions = []
+        for tunnel in colony.tunnels:
+            empty = [p for p in tunnel.places
+                     if p.ant is None and p.name not in used]
+            for place in empty[:self.places_per_tunnel]:
+                for name in affordable:
+                    if colony.ant_types[name].is_watersafe or not isinstance(place, Water):
+                        actions.append(('deploy', place.name, name))
+            if self.allow_remove:
+                actions.extend(('remove', p.name) for p in tunnel.places
+                               if p.ant is not None and p.name not in used)
+        return actions
+
+    def score(self, data, candidates, deadline):
+        """Return (sequence, score) pairs for the CANDIDATES that could be
+        scored before DEADLINE, always including the first."""
+        args = (self.horizon, self.rollouts, self.policy, self.evaluate, deadline)
+        if not self.workers or self.workers == 1:
+            return score_sequences(data, candidates, *args)
+        if self._pool is None:
+            self._pool = Pool(self.workers)
+        chunks = [candidates[i::self.workers] for i in range(self.workers)]
+        tasks = [(data, chunk) + args for chunk in chunks if chunk]
+        return [pair for scored in self._pool.starmap(score_sequences, tasks)
+                for pair in scored]
+
+    def close(self):
+        """Stop the worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+def apply_action(colony, action):
+    """Take ACTION, a ('deploy', place name, ant type name) or ('remove',
+    place name) tuple, in COLONY."""
+    if action[0] == 'deploy':
+        colony.deploy_ant(action[1], action[2])
+    else:
+        colony.remove_ant(action[1])
+
+def clone_data(colony):
+    """Return a picklable copy of COLONY, its random state and the QueenAnt
+    flag, from which clone makes colonies for rollouts."""
+    saved = (colony.rng, colony.strategy, colony.state, colony._touched,
+             colony._changed)
+    (colony.rng, colony.strategy, colony.state, colony._touched,
+     colony._changed) = None, None, None, None, None
+    try:
+        return pickle.dumps((colony, saved[0].getstate(), QueenAnt.queen_status))
+    finally:
+        (colony.rng, colony.strategy, colony.state, colony._touched,
+         colony._changed) = saved
+
+def clone(data):
+    """Return the colony pickled in DATA by clone_data, with a random stream
+    of its own and no strategy."""
+    colony, rng_state, queen_status = pickle.loads(data)
+    QueenAnt.queen_status = queen_status
+    colony.rng = random.Random()
+    colony.rng.setstate(rng_state)
+    return colony
+
+def rollout(colony, horizon, policy, evaluate):
+    """Play HORIZON turns of COLONY with the strategy POLICY, starting after
+    the strategy of the first turn, and return the score of the result."""
+    colony.strategy = idle_strategy
+    try:
+        for _ in range(horizon):
+            colony.take_turn()
+            colony.strategy = policy
+            if colony.num_bees == 0 and not colony.active_bees:
+                return evaluate(colony, 'ants')
+            colony.time += 1
+    except BeesWinException:
+        return evaluate(colony, 'bees')
+    return evaluate(colony, None)
+
+def score_sequences(data, candidates, horizon, rollouts, policy, evaluate,
+                    deadline):
+    """Return (sequence, mean score) pairs for the CANDIDATES action
+    sequences, scored on a clone of the colony in DATA until DEADLINE.
+
+    Every rollout starts from the same snapshot, so a sequence scores the
+    same however many rollouts came before it, even when ants die inside
+    their containers:
+
+    >>> from ants_batch import GameConfig, make_colony
+    >>> from ants_plans import make_hard_assault_plan
+    >>> colony = make_colony(GameConfig(make_hard_assault_plan, dry_layout,
+    ...                                 (1, 6), food=40, seed=1))
+    >>> for i in range(6):
+    ...     thrower = colony.deploy_ant('tunnel_0_%d' % i, 'Thrower')
+    >>> for i in range(3, 6):
+    ...     guard = colony.deploy_ant('tunnel_0_%d' % i, 'Bodyguard')
+    >>> for _ in range(4):
+    ...     colony.take_turn()
+    ...     colony.time += 1
+    >>> candidates = [(), (('deploy', 'tunnel_0_2', 'Bodyguard'),),
+    ...               (('deploy', 'tunnel_0_1', 'Tank'),)]
+    >>> scored = score_sequences(clone_data(colony), candidates * 2, 8, 1,
+    ...                          thrower_policy, evaluate, float('inf'))
+    >>> scored[:3] == scored[3:]
+    True
+    """
+    colony = clone(data)
+    start = colony.snapshot()
+    scored = []
+    queen_status = QueenAnt.queen_status
+    try:
+        with event_bus.mute(colony):  # Rollouts are not part of the game
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                for seq in candidates:
+                    if scored and time.monotonic() >= deadline:
+                        break
+                    total = 0
+                    for r in range(rollouts):
+                        colony.restore(start)
+                        colony.rng.seed(colony.time * rollouts + r)
+                        for action in seq:
+                            apply_action(colony, action)
+                        total += rollout(colony, horizon, policy, evaluate)
+                    scored.append((seq, total / rollouts))
+    finally:
+        QueenAnt.queen_status = queen_status
+    return scored
+
+@main
+def run(*args):
+    import argparse
+    from ants_bench import PLANS
+    from ants_batch import GameConfig, make_colony
+    parser = argparse.ArgumentParser(description="Watch a search strategy play")
+    parser.add_argument('plan', choices=list(PLANS), help='the assault plan')
+    parser.add_argument('-w', '--water', action='store_true',
+                        help='loads a full layout with water')
+    parser.add_argument('--tunnels', type=int, default=3)
+    parser.add_argument('--length', type=int, default=10)
+    parser.add_argument('--food', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget', type=float, default=1.0,
+                        help='seconds of search per turn')
+    parser.add_argument('--horizon', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    strategy = SearchStrategy(args.budget, args.horizon, workers=args.workers)
+    layout = wet_layout if args.water else dry_layout
+    config = GameConfig(PLANS[args.plan], layout, (args.tunnels, args.length),
+                        args.food, strategy, args.seed)
+    colony = make_colony(config)
+    try:
+        colony.simulate()
+    finally:
+        strategy.close()
+    print(colony)
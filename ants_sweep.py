@@ -0,0 +1,244 @@
+"""Parameter sweeps over many headless Ants Vs. SomeBees games.
+
+A sweep plays every combination of difficulties, layouts, tunnel counts,
+tunnel lengths, starting food, scripts and seeds across a pool of worker
+processes. Each result is written as one JSON or CSV line as soon as its game
+finishes, so a sweep holds only a bounded number of games in memory, and an
+interrupted sweep resumes by skipping the games already in its output file:
+
+    python3 ants_sweep.py -d easy,normal -w dry,wet --length 8-12 --food 2-6 \\
+        --seeds 0-9 --output results.jsonl --resume
+
+The same options follow --sweep on the command line of ants_plans.py.
+
+>>> parse_range('1-3,5')
+[1, 2, 3, 5]
+>>> games = list(sweep_games(['test'], ['dry', 'wet'], None, [9], [2, 4],
+...                          ['throwers'], [0]))
+>>> len(games)
+4
+>>> games[-1][0]
+('test', 'wet', 1, 9, 4, 'throwers', 0)
+"""
+
+import csv
+import itertools
+import json
+import os
+import queue
+import sys
+from multiprocessing import Pool
+
+from ants import *
+from ants_batch import GameConfig, _play_indexed
+from ants_bench import PLANS, LAYOUTS, SCRIPTS
+from ants_plans import ScriptedStrategy, idle_strategy
+from ucb import main
+
+# The tunnel count of each difficulty in start_with_strategy
+TUNNELS = {'test': 1, 'easy': 2, 'normal': 3, 'hard': 4, 'extra-hard': 4}
+
+KEY_FIELDS = ['difficulty', 'layout', 'tunnels', 'length', 'food', 'script',
+              'seed']
+FIELDS = KEY_FIELDS + ['winner', 'time', 'food_left', 'ants', 'bees']
+
+def parse_range(text):
+    """Return the list of ints in TEXT, a comma-separated list of numbers and
+    inclusive ranges such as 2-5."""
+    values = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        values.extend(range(int(first), int(last or first) + 1))
+    return values
+
+def parse_names(choices):
+    """Return an argparse type for comma-separated lists of CHOICES."""
+    def parse(text):
+        names = text.split(',')
+        for name in names:
+            if name not in choices:
+                raise ValueError(name)
+        return names
+    parse.__name__ = 'list'
+    return parse
+
+###############
+# Sweep Games #
+###############
+
+def sweep_games(difficulties, layouts, tunnels, lengths, foods, scripts, seeds):
+    """Yield a (key, GameConfig) pair for every combination of the options,
+    where KEY holds the values of KEY_FIELDS. Tunnel counts default to those
+    of each difficulty if TUNNELS is None."""
+    for difficulty, layout_name in itertools.product(difficulties, layouts):
+        layout, moat_frequency = LAYOUTS[layout_name]
+        for num_tunnels, length, food, script_name, seed in itertools.product(
+                tunnels or [TUNNELS[difficulty]], lengths, foods, scripts, seeds):
+            script = SCRIPTS[script_name]
+            strategy = idle_strategy
+            if script is not None:
+                strategy = ScriptedStrategy(script(num_tunnels, length, moat_frequency))
+            key = (difficulty, layout_name, num_tunnels, length, food,
+                   script_name, seed)
+            yield key, GameConfig(PLANS[difficulty], layout, (num_tunnels, length),
+                                  food, strategy, seed)
+
+def play_bounded(configs, workers=None, window=None):
+    """Play the GameConfigs of the (index, config) pairs in CONFIGS across
+    WORKERS processes and yield each GameResult as it finishes. At most
+    WINDOW games are waiting to be played at once, so CONFIGS may be a
+    generator of any length."""
+    if workers == 1:
+        for indexed_config in configs:
+            yield _play_indexed(indexed_config)
+        return
+    finished = queue.Queue()
+    def take():
+        result = finished.get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+    with Pool(workers) as pool:
+        window = window or 4 * (workers or os.cpu_count() or 1)
+        pending = 0
+        for indexed_config in configs:
+            if pending >= window:
+                yield take()
+                pending -= 1
+            pool.apply_async(_play_indexed, (indexed_config,),
+                             callback=finished.put, error_callback=finished.put)
+            pending += 1
+        for _ in range(pending):
+            yield take()
+
+##########
+# Output #
+##########
+
+def record(key, result):
+    """Return the output record of the game with KEY and RESULT."""
+    values = list(key) + [result.winner, result.time, result.food,
+                          len(result.ants), len(result.bees)]
+    return dict(zip(FIELDS, values))
+
+def finished_keys(path, form):
+    """Return the set of game keys already in the output file at PATH,
+    dropping a partly written last line so that new lines can follow."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb+') as f:
+        data = f.read()
+        f.truncate(data.rfind(b'\n') + 1)
+    with open(path, newline='') as f:
+        if form == 'csv':
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        return {tuple(str(r[field]) for field in KEY_FIELDS) for r in records}
+
+class Writer(object):
+    """Writes records to a file as JSON lines or CSV rows, flushing each."""
+
+    def __init__(self, f, form, header=True):
+        self.f = f
+        self.form = form
+        if form == 'csv':
+            self.rows = csv.DictWriter(f, FIELDS, lineterminator='\n')
+            if header:
+                self.rows.writeheader()
+
+    def write(self, rec):
+        if self.form == 'csv':
+            self.rows.writerow(rec)
+        else:
+            self.f.write(json.dumps(rec) + '\n')
+        self.f.flush()
+
+#########
+# Sweep #
+#########
+
+def sweep(args):
+    """Run the sweep described by the command-line arguments ARGS."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Sweep Ants Vs. SomeBees games")
+    parser.add_argument('--sweep', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('-d', type=parse_names(PLANS), metavar='DIFFICULTIES',
+                        default=['normal'], help='difficulties, such as easy,hard')
+    parser.add_argument('-w', '--water', type=parse_names(LAYOUTS), nargs='?',
+                        const=['wet'], default=['dry'], metavar='LAYOUTS',
+                        help='layouts: dry, wet or dry,wet (wet if given alone)')
+    parser.add_argument('--tunnels', type=parse_range,
+                        help='tunnel counts (defaults to those of each difficulty)')
+    parser.add_argument('--length', type=parse_range, default=[10],
+                        help='tunnel lengths, such as 8-12')
+    parser.add_argument('--food', type=parse_range, default=[2],
+                        help='starting food, such as 2,4,6')
+    parser.add_argument('--script', type=parse_names(SCRIPTS), default=['throwers'],
+                        help='scripts that deploy ants: idle, throwers or mixed')
+    parser.add_argument('--seeds', type=parse_range, default=[0],
+                        help='random seeds, such as 0-9')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None,
+                        help='output format (defaults to the output file suffix)')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write results to FILE instead of standard output')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the games already in the output file')
+    parser.add_argument('--cache', metavar='FILE',
+                        help='keep game results in the SQLite database FILE')
+    args = parser.parse_args(args)
+
+    form = args.format
+    if form is None:
+        form = 'csv' if args.output and args.output.endswith('.csv') else 'jsonl'
+    done = set()
+    if args.resume:
+        if not args.output:
+            parser.error('--resume needs an --output file')
+        done = finished_keys(args.output, form)
+    games = sweep_games(args.d, args.water, args.tunnels, args.length,
+                        args.food, args.script, args.seeds)
+    cache, fingerprints = None, {}
+    if args.cache:
+        from ants_cache import GameCache, fingerprint
+        cache = GameCache(args.cache)
+    mode = 'a' if args.resume else 'w'
+    out = open(args.output, mode, newline='') if args.output else sys.stdout
+    writer = Writer(out, form, header=out is sys.stdout or out.tell() == 0)
+    counts = {'played': 0, 'cached': 0, 'skipped': 0}
+
+    def unplayed():
+        """Yield the games to play, indexed by key, writing cached results."""
+        for key, config in games:
+            if tuple(map(str, key)) in done:
+                counts['skipped'] += 1
+                continue
+            if cache is not None:
+                fingerprints[key] = fingerprint(config)
+                result = fingerprints[key] and cache.get(fingerprints[key], key)
+                if result:
+                    del fingerprints[key]
+                    counts['cached'] += 1
+                    writer.write(record(key, result))
+                    continue
+            yield key, config
+
+    try:
+        for result in play_bounded(unplayed(), args.workers):
+            if fingerprints.get(result.index):
+                cache.put(fingerprints[result.index], result)
+            fingerprints.pop(result.index, None)
+            counts['played'] += 1
+            writer.write(record(result.index, result))
+    finally:
+        if cache is not None:
+            cache.close()
+        if out is not sys.stdout:
+            out.close()
+    print('{played} games played, {cached} cached, {skipped} skipped'.format(**counts),
+          file=sys.stderr)
+
+@main
+def run(*args):
+    sweep(list(args))
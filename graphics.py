@@ -1,7 +1,9 @@
 """The graphics module implements a simple GUI library."""
 
+import json
 import sys
 import math
+import time
 
 try:
     import tkinter
@@ -45,13 +47,24 @@ class Canvas(object):
         self._canvas.pack()
         self._draw_background()
         self._canvas.update()
-        self._images = dict()
+        self._images = dict()  # (image file, scale) -> PhotoImage
+        self.load_seconds = 0  # Seconds spent by preload_images
+
+        # Animations, all advanced by one frame clock
+        self._animations = dict()  # shape id -> [max frames, points_fn, start, frame]
+        self._ticking = False
+        self._last_tick = None
+        self.frame_time = FRAME_TIME  # Moving average of seconds per frame
+        self.dropped_frames = 0  # Animation frames skipped to keep up
 
     def clear(self, shape='all'):
         """Clear all shapes, text, and images."""
         self._canvas.delete(shape)
         if shape == 'all':
+            self._animations.clear()
             self._draw_background()
+        else:
+            self._animations.pop(shape, None)
         self._canvas.update()
 
     def draw_polygon(self, points, color='Black', fill_color=None, filled=1, smooth=0, width=1):
@@ -90,22 +103,70 @@ class Canvas(object):
 
     def draw_image(self, pos, image_file=None, scale=1, anchor=tkinter.NW, behind=0):
         """Draw an image from a file and return its tkinter id."""
-        key = (image_file, scale)
-        if key not in self._images:
-            image = tkinter.PhotoImage(file=image_file)
-            if scale >= 1:
-                image = image.zoom(int(scale))
-            else:
-                image = image.subsample(int(1/scale))
-            self._images[key] = image
-
-        image = self._images[key]
+        image = self.load_image(image_file, scale)
         x, y = pos
         id = self._canvas.create_image(x, y, image=image, anchor=anchor)
         if behind > 0:
             self._canvas.tag_lower(id, behind)
         return id
 
+    def load_image(self, image_file, scale=1):
+        """Return the image in IMAGE_FILE at SCALE, loading and scaling it
+        only the first time."""
+        key = (image_file, scale)
+        if key not in self._images:
+            image = self._images.get((image_file, 1))
+            if image is None:
+                image = tkinter.PhotoImage(file=image_file)
+                self._images[(image_file, 1)] = image
+            if scale > 1:
+                image = image.zoom(int(scale))
+            elif scale < 1:
+                image = image.subsample(int(1/scale))
+            self._images[key] = image
+        return self._images[key]
+
+    def preload_images(self, image_files, scales=(1,), atlas=None):
+        """Load every distinct image file in IMAGE_FILES at each of SCALES,
+        cutting them from the sprite ATLAS made by save_atlas if one is
+        given, and return the seconds it took, which are kept as
+        load_seconds."""
+        start = time.time()
+        image_files = sorted(set(image_files))
+        if atlas is not None:
+            self._load_atlas(atlas, image_files)
+        for image_file in image_files:
+            for scale in scales:
+                self.load_image(image_file, scale)
+        self.load_seconds = time.time() - start
+        return self.load_seconds
+
+    def save_atlas(self, image_files, atlas):
+        """Pack every distinct image file in IMAGE_FILES into one PNG image
+        ATLAS, with the position of each in ATLAS.json."""
+        image_files = sorted(set(image_files))
+        images = [self.load_image(f) for f in image_files]
+        positions, (width, height) = pack_atlas([(i.width(), i.height()) for i in images])
+        sheet = tkinter.PhotoImage(width=width, height=height)
+        index = {}
+        for image_file, image, (x, y) in zip(image_files, images, positions):
+            sheet.tk.call(sheet, 'copy', image, '-to', x, y)
+            index[image_file] = [x, y, image.width(), image.height()]
+        sheet.write(atlas, format='png')
+        with open(atlas + '.json', 'w') as f:
+            json.dump(index, f)
+
+    def _load_atlas(self, atlas, image_files):
+        sheet = tkinter.PhotoImage(file=atlas)
+        with open(atlas + '.json') as f:
+            index = json.load(f)
+        for image_file in image_files:
+            if image_file in index and (image_file, 1) not in self._images:
+                x, y, width, height = index[image_file]
+                image = tkinter.PhotoImage(width=width, height=height)
+                image.tk.call(image, 'copy', sheet, '-from', x, y, x + width, y + height)
+                self._images[(image_file, 1)] = image
+
     def draw_text(self, text, pos, color='Black', font='Arial',
                   size=12, style='normal', anchor=tkinter.NW):
         """Draw text and return its tkinter id."""
@@ -123,21 +184,50 @@ class Canvas(object):
         if font is not None:
             self._canvas.itemconfigure(id, font=(font, str(size), style))
 
-    def animate_shape(self, id, duration, points_fn, frame_count=0):
-        """Animate an existing shape over points."""
-        max_frames = duration // FRAME_TIME
-        points = points_fn(frame_count)
-        self._canvas.coords(id, flattened(points))
-        if frame_count < max_frames:
-            def tail():
-                """Continues the animation at the next frame."""
-                self.animate_shape(id, duration, points_fn, frame_count + 1)
-            self._tk.after(int(FRAME_TIME * 1000), tail)
+    def animate_shape(self, id, duration, points_fn):
+        """Animate an existing shape over points, replacing any animation of
+        the shape that is still running.
+
+        All animations are advanced together by one frame clock. Frames are
+        timed from the start of each animation, so frames are dropped when
+        drawing falls behind."""
+        self._animations[id] = [duration // FRAME_TIME, points_fn, time.time(), 0]
+        self._canvas.coords(id, flattened(points_fn(0)))
+        if not self._ticking:
+            self._ticking = True
+            self._last_tick = time.time()
+            self._tk.after(int(FRAME_TIME * 1000), self._tick)
+
+    def cancel_animation(self, id):
+        """Stop animating shape ID, leaving it where it is."""
+        self._animations.pop(id, None)
+
+    def _tick(self):
+        """Advance every animation to the current frame."""
+        now = time.time()
+        self.frame_time += (now - self._last_tick - self.frame_time) / 10
+        self._last_tick = now
+        for id, animation in list(self._animations.items()):
+            max_frames, points_fn, start, last = animation
+            frame = min(int((now - start) / FRAME_TIME), max_frames)
+            if frame > last:
+                self.dropped_frames += frame - last - 1
+                animation[3] = frame
+                self._canvas.coords(id, flattened(points_fn(frame)))
+            if frame >= max_frames:
+                del self._animations[id]
+        if self._animations:
+            spent = time.time() - now
+            delay = max(1, int((FRAME_TIME - spent) * 1000))
+            self._tk.after(delay, self._tick)
+        else:
+            self._ticking = False
 
     def slide_shape(self, id, end_pos, duration, elapsed=0):
         """Slide an existing shape to end_pos."""
         points = paired(self._canvas.coords(id))
         start_pos = points[0]
+        duration = max(duration, FRAME_TIME)
         max_frames = duration // FRAME_TIME
         def points_fn(frame_count):
             completed = frame_count / max_frames
@@ -165,6 +255,12 @@ class Canvas(object):
             elapsed += FRAME_TIME
         return None, elapsed
 
+    def take_click(self):
+        """Return the (x, y) position of the last click since the last call
+        to take_click or wait_for_click, or None."""
+        pos, self._click_pos = self._click_pos, None
+        return pos
+
     def _draw_background(self):
         w, h = self.width - 1, self.height - 1
         corners = [(0,0), (0, h), (w, h), (w, 0)]
@@ -178,6 +274,27 @@ class Canvas(object):
         self._tk.after(int(1000 * seconds), self._tk.quit)
         self._tk.mainloop()
 
+def pack_atlas(sizes, max_width=1024):
+    """Return the positions at which to put images of the given (width,
+    height) SIZES in a sprite atlas, in shelves no wider than MAX_WIDTH, and
+    the size of the atlas.
+
+    >>> pack_atlas([(60, 70), (50, 40), (60, 70)], max_width=130)
+    ([(0, 0), (0, 70), (60, 0)], (120, 110))
+    """
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    positions = [None] * len(sizes)
+    x = y = shelf = width = 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w > max_width and x > 0:
+            x, y, shelf = 0, y + shelf, 0
+        positions[i] = (x, y)
+        x += w
+        shelf = max(shelf, h)
+        width = max(width, x)
+    return positions, (width, y + shelf)
+
 def flattened(points):
     """Return a flat list of coordinates from a list of pairs."""
     coords = list()
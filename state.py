@@ -1,10 +1,44 @@
+MISSING = object()  # The value of a key that a version does not have
+
 class State:
-    """A State holds a current game state and all of its attributes"""
+    """A State holds a current game state and all of its attributes.
+
+    States are versioned. commit() turns the updates made since the last
+    commit into a new version, whose parent is the current version. A version
+    only stores the keys updated in it, along with their previous values, so
+    unchanged keys are shared with earlier versions instead of copied.
+    checkout() makes any version current by undoing and redoing only the
+    versions between the two, and committing after a checkout forks a new
+    branch of versions.
+
+    >>> s = State()
+    >>> s.updateState('food', 2)
+    >>> v0 = s.commit()
+    >>> s.updateState('food', 5)
+    >>> s.updateState('time', 1)
+    >>> v1 = s.commit()
+    >>> s.checkout(v0) == {'food': 2, 'time': MISSING}
+    True
+    >>> s.getState()
+    {'food': 2}
+    >>> s.updateState('food', 3)
+    >>> v2 = s.commit()
+    >>> s.checkout(v1) == {'food': 5, 'time': 1}
+    True
+    >>> s.parent(v2) == s.parent(v1) == v0
+    True
+    """
 
     def __init__(self):
         """Create a new gamestate"""
         self.gs = {}
-
+        self.version = None  # The current version, if any has been committed
+        self._parents = []   # The parent of each version
+        self._depths = []    # The number of ancestors of each version
+        self._redo = []      # The keys updated in each version, with values
+        self._undo = []      # The same keys, with their values in the parent
+        self._pending = {}   # Keys updated since the last commit or checkout
+        self._before = {}    # Their values at the last commit or checkout
 
     def getState(self, key=None):
         if key:
@@ -12,7 +46,54 @@ class State:
         return self.gs
 
     def updateState(self, key, val):
+        if key not in self._before:
+            self._before[key] = self.gs.get(key, MISSING)
         self.gs[key] = val
+        self._pending[key] = val
+
+    def commit(self):
+        """Record the updates since the last commit as a new version, and
+        return its number."""
+        version = len(self._parents)
+        self._parents.append(self.version)
+        self._depths.append(0 if self.version is None else self._depths[self.version] + 1)
+        self._redo.append(self._pending)
+        self._undo.append(self._before)
+        self._pending, self._before = {}, {}
+        self.version = version
+        return version
 
+    def parent(self, version):
+        """Return the version that VERSION was committed after, or None."""
+        return self._parents[version]
 
+    def checkout(self, version):
+        """Make VERSION current, discarding uncommitted updates, and return a
+        dict of the keys whose values may have changed, with their new values.
+        Keys that VERSION does not have are given the value MISSING."""
+        changes = {}
+        def apply(values):
+            for key, val in values.items():
+                if val is MISSING:
+                    self.gs.pop(key, None)
+                else:
+                    self.gs[key] = val
+                changes[key] = val
+        apply(self._before)
+        self._pending, self._before = {}, {}
 
+        # Undo up from the current version and redo down to VERSION, meeting
+        # at their closest common ancestor.
+        up, down = self.version, version
+        redo = []
+        while up != down:
+            if up is not None and (down is None or self._depths[up] >= self._depths[down]):
+                apply(self._undo[up])
+                up = self._parents[up]
+            else:
+                redo.append(down)
+                down = self._parents[down]
+        for v in reversed(redo):
+            apply(self._redo[v])
+        self.version = version
+        return changes
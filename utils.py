@@ -55,6 +55,22 @@ def print_expired_insects(self, rv, *args):
         print('{0}({1}) ran out of armor and expired'.format(
             type(self).__name__, self.place))
 
+def print_expired(kind, insect, place):
+    """Sink for death events that prints a message when an insect expires.
+
+    >>> from ants import Bee, Place, event_bus
+    >>> event_bus.subscribe(print_expired, ['death'])
+    >>> place = Place('Test')
+    >>> bee = Bee(3)
+    >>> place.add_insect(bee)
+    >>> bee.reduce_armor(2)
+    >>> bee.reduce_armor(1)
+    Bee(Test) ran out of armor and expired
+    >>> event_bus.unsubscribe(print_expired)
+    """
+    print('{0}({1}) ran out of armor and expired'.format(
+        type(insect).__name__, place))
+
 def print_thrower_target(self, rv, *args):
     """Prints the target of a ThrowerAnt, if the ThrowerAnt found a target.
 